@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+# benchmark.py -- load test for the tournament project
+# This file generates synthetic Swiss-system events of any size, plays them
+# through tournament.py the same way populate_data.py does, and reports how
+# long each operation took as JSON so runs can be compared.
+#
+# Like tournament_test.py, this deletes every player and match before it
+# starts, so point it at a scratch database (see configure() and the
+# TOURNAMENT_DSN environment variable) or use --backend memory.
+#
+# Examples:
+#   python benchmark.py --players 16 --players 1024 --tournaments 20
+#   python benchmark.py --backend memory --players 100000 --output new.json
+#   python benchmark.py --players 512 --compare old.json
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+import storage
+import tournament
+from populate_data import theResults
+
+# The operations that are timed, in the order they are reported.
+OPERATIONS = ['registerPlayers', 'swissPairings', 'reportMatch',
+              'reportRound', 'playerStandings']
+
+
+class _Timings(object):
+    """Collects the latency and statement count of every timed call."""
+
+    def __init__(self):
+        self.latencies = dict((operation, []) for operation in OPERATIONS)
+        self.statements = dict((operation, 0) for operation in OPERATIONS)
+
+    def call(self, operation, function, *args):
+        """Calls function(*args), recording how long it took."""
+        backend = tournament.getBackend()
+        statements = backend.counters()['statements']
+        start = time.time()
+        result = function(*args)
+        self.latencies[operation].append(time.time() - start)
+        self.statements[operation] += (backend.counters()['statements'] -
+                                       statements)
+        return result
+
+    def merge(self, other):
+        for operation in OPERATIONS:
+            self.latencies[operation].extend(other.latencies[operation])
+            self.statements[operation] += other.statements[operation]
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of a sorted list of values."""
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def roundsFor(players):
+    """Returns the usual number of Swiss rounds for a field of players."""
+    return max(1, int(math.ceil(math.log(players, 2))))
+
+
+def playEvent(code, players, rounds, batch, seed):
+    """Registers a synthetic field and plays every round of it.
+
+    Args:   code:  The tournament code to use.
+            players:  The number of players to register.
+            rounds:  The number of rounds to play.
+            batch:  Report each round with reportRound() instead of one
+                reportMatch() per table.
+            seed:  Seed for the random match results.
+
+    Returns:  The _Timings of the event.
+    """
+    timings = _Timings()
+    results = random.Random(seed)
+    names = ['%s Player %d' % (code, number) for number in range(players)]
+    timings.call('registerPlayers', tournament.registerPlayers, code, names)
+    for number in range(rounds):
+        pairings = timings.call('swissPairings', tournament.swissPairings, code)
+        roundResults = [(pair[0], pair[2],
+                         'win' if pair[2] == 0 else results.choice(theResults))
+                        for pair in pairings]
+        if batch:
+            timings.call('reportRound', tournament.reportRound, code,
+                         roundResults)
+        else:
+            for playerID, opponent, result in roundResults:
+                timings.call('reportMatch', tournament.reportMatch, code,
+                             playerID, opponent, result)
+        timings.call('playerStandings', tournament.playerStandings, code)
+    return timings
+
+
+def run(players, tournaments, rounds=None, batch=False, threads=1, seed=0):
+    """Plays a number of same-sized events at once and summarises them.
+
+    Returns:  A dictionary describing the run, ready to be dumped as JSON.
+    """
+    rounds = rounds or roundsFor(players)
+    codes = ['%03d' % number for number in range(tournaments)]
+    tournament.deleteMatches()
+    tournament.deletePlayers()
+    pool = ThreadPool(threads)
+    start = time.time()
+    events = pool.map(lambda code: playEvent(code, players, rounds, batch,
+                                             seed + codes.index(code)),
+                      codes)
+    elapsed = time.time() - start
+    pool.close()
+    timings = _Timings()
+    for event in events:
+        timings.merge(event)
+    summary = {
+        'players': players,
+        'tournaments': tournaments,
+        'rounds': rounds,
+        'batch': batch,
+        'threads': threads,
+        'seconds': elapsed,
+        'operations': {},
+    }
+    for operation in OPERATIONS:
+        latencies = sorted(timings.latencies[operation])
+        if not latencies:
+            continue
+        summary['operations'][operation] = {
+            'calls': len(latencies),
+            'perSecond': len(latencies) / elapsed if elapsed else None,
+            'mean': sum(latencies) / len(latencies),
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+            'statements': timings.statements[operation],
+        }
+    return summary
+
+
+def compare(old, new):
+    """Returns lines comparing the p50 and p99 latencies of two reports."""
+    lines = []
+    oldRuns = dict(((entry['players'], entry['tournaments']), entry)
+                   for entry in old['runs'])
+    for entry in new['runs']:
+        before = oldRuns.get((entry['players'], entry['tournaments']))
+        if before is None:
+            continue
+        for operation, stats in sorted(entry['operations'].items()):
+            previous = before['operations'].get(operation)
+            if not previous:
+                continue
+            lines.append('%7d players x %4d  %-16s p50 %+7.1f%%  p99 %+7.1f%%' % (
+                entry['players'], entry['tournaments'], operation,
+                _change(previous['p50'], stats['p50']),
+                _change(previous['p99'], stats['p99'])))
+    return lines
+
+
+def _change(before, after):
+    """Returns the percentage change from before to after."""
+    if not before:
+        return 0.0
+    return (after - before) * 100.0 / before
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time the tournament functions on synthetic events.')
+    parser.add_argument('--players', type=int, action='append',
+                        help='players per tournament, may be repeated '
+                             '(default: 16, 128 and 1024)')
+    parser.add_argument('--tournaments', type=int, default=1,
+                        help='tournaments played at once (default: 1)')
+    parser.add_argument('--rounds', type=int,
+                        help='rounds per tournament (default: log2 of players)')
+    parser.add_argument('--batch', action='store_true',
+                        help='report rounds with reportRound()')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='tournaments played in parallel (default: 1)')
+    parser.add_argument('--backend', choices=['postgres', 'memory'],
+                        default=tournament.BACKEND)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report to a file')
+    parser.add_argument('--compare', help='a previous JSON report to compare '
+                                          'this run against')
+    args = parser.parse_args(argv)
+    if args.backend == 'memory':
+        tournament.useBackend(storage.MemoryBackend())
+    else:
+        tournament.configure(maxconn=max(args.threads, tournament.MAX_CONNECTIONS))
+    report = {'backend': args.backend, 'runs': []}
+    for players in args.players or [16, 128, 1024]:
+        report['runs'].append(run(players, args.tournaments, args.rounds,
+                                  args.batch, args.threads, args.seed))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print text
+    if args.compare:
+        with open(args.compare) as previous:
+            for line in compare(json.load(previous), report):
+                sys.stderr.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
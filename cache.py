@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# cache.py -- versioned standings cache for the tournament project
+# This file keeps recent standings reads in memory so repeated reads of a
+# tournament that has not changed are not sent to the database.  Every
+# tournament has a version number that is bumped whenever its players or
+# matches change; a cached read is only used while its version is current.
+
+import threading
+from collections import OrderedDict
+
+
+class StandingsCache(object):
+    """A least recently used cache of per-tournament reads.
+
+    Entries are keyed by tournament and kind of read, and are dropped, least
+    recently used first, once the cache holds more than maxRows rows.  Reads
+    of every tournament ('blnk') are invalidated by a change to any of them.
+
+    Args:   maxRows:  The most rows the cache will hold across all entries.
+    """
+
+    def __init__(self, maxRows=100000):
+        self.maxRows = maxRows
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._rows = 0
+        # tournament -> version, bumped on every change to that tournament
+        self._versions = {}
+        # bumped on every change to any tournament
+        self._allVersion = 0
+        # bumped when every tournament changes at once
+        self._epoch = 0
+
+    def version(self, tournament):
+        """Returns the current version of a tournament's data."""
+        with self._lock:
+            return self._version(tournament)
+
+    def _version(self, tournament):
+        if tournament == 'blnk':
+            return (self._epoch, self._allVersion)
+        return (self._epoch, self._versions.get(tournament, 0))
+
+    def bump(self, tournament='blnk'):
+        """Marks one tournament, or with 'blnk' every tournament, as changed."""
+        with self._lock:
+            if tournament == 'blnk':
+                self._epoch += 1
+                self._versions.clear()
+            else:
+                self._versions[tournament] = self._versions.get(tournament, 0) + 1
+            self._allVersion += 1
+
+    def get(self, tournament, kind, version):
+        """Returns a cached read, or None if it is missing or out of date.
+
+        Args:   tournament:  The tournament the read was for.
+                kind:  What was read, e.g. 'standings'.
+                version:  The version returned by version() before reading.
+        """
+        key = (tournament, kind)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._rows -= entry[2]
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def put(self, tournament, kind, version, value, rows):
+        """Stores a read taken at a version returned by version().
+
+        Args:   rows:  How many rows the value holds, which counts towards
+                    maxRows.
+        """
+        key = (tournament, kind)
+        with self._lock:
+            if version != self._version(tournament) or rows > self.maxRows:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._rows -= previous[2]
+            self._entries[key] = (version, value, rows)
+            self._rows += rows
+            while self._rows > self.maxRows:
+                oldKey, oldEntry = self._entries.popitem(last=False)
+                self._rows -= oldEntry[2]
+
+    def clear(self):
+        """Drops every cached read."""
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+            self._epoch += 1
+            self._versions.clear()
+            self._allVersion += 1
@@ -0,0 +1,86 @@
+-- Export for the tournament project: upgrade a database from an older schema.
+--
+-- Databases created by an older tournament.sql, such as the original one
+-- that keeps every match in the matches table twice, once from each
+-- player's side, can not be altered into the current schema in place.
+-- Instead this writes their players and matches to players.csv and
+-- matches.csv, in the current directory, in the format written by
+-- exportTournament().  The database is only read.  Then recreate it and
+-- import the files:
+--
+--   psql -f export_legacy.sql
+--   psql -f tournament.sql
+--   python -c "import tournament; tournament.importTournament(
+--       open('players.csv'), open('matches.csv'))"
+--
+-- Every player must have a tournament code, since the current schema keeps
+-- each tournament in partitions of its own.
+
+\c tournament;
+
+
+CREATE TEMPORARY VIEW legacy_players AS
+	SELECT players.tournament, players.id, players.name
+	FROM players
+	WHERE players.id <> 0
+	ORDER BY players.id;
+
+
+/*
+Keep the row each match was reported with (the first of its rows), with a
+bye always from the side of the player who had it, and number the rounds: a
+player's nth match is their round n, and a match is played in the later of
+its two players' rounds.  The matches table of the original schema and the
+matches view of later ones have the same columns, so either can be read.
+*/
+CREATE TEMPORARY VIEW legacy_games AS
+	WITH sides AS (
+		SELECT
+			matches.entry AS entry,
+			CASE WHEN matches.player_id = 0 THEN matches.opponent_id
+				ELSE matches.player_id END AS player_a,
+			CASE WHEN matches.player_id = 0 THEN 0
+				ELSE matches.opponent_id END AS player_b,
+			CASE WHEN matches.result = 'tie' THEN 't'
+				WHEN (matches.result = 'win') = (matches.player_id <> 0)
+				THEN 'a' ELSE 'b' END AS outcome
+		FROM matches
+	), reported AS (
+		SELECT DISTINCT ON (LEAST(sides.player_a, sides.player_b),
+							GREATEST(sides.player_a, sides.player_b))
+			sides.*
+		FROM sides
+		ORDER BY LEAST(sides.player_a, sides.player_b),
+				 GREATEST(sides.player_a, sides.player_b),
+				 sides.entry
+	), numbered AS (
+		SELECT
+			played.entry AS entry,
+			row_number() OVER (
+				PARTITION BY played.player_id ORDER BY played.entry) AS number
+		FROM (
+			SELECT reported.entry, reported.player_a AS player_id
+			FROM reported
+			UNION ALL
+			SELECT reported.entry, reported.player_b
+			FROM reported
+			WHERE reported.player_b <> 0
+		) AS played
+	)
+	SELECT
+		players.tournament AS tournament,
+		max(numbered.number) AS round,
+		reported.player_a AS player_a,
+		reported.player_b AS player_b,
+		reported.outcome AS outcome
+	FROM reported JOIN numbered
+	ON numbered.entry = reported.entry
+	JOIN players
+	ON players.id = reported.player_a
+	GROUP BY reported.entry, players.tournament, reported.player_a,
+		reported.player_b, reported.outcome
+	ORDER BY reported.entry;
+
+
+\copy (SELECT * FROM legacy_players) TO 'players.csv' WITH CSV HEADER
+\copy (SELECT * FROM legacy_games) TO 'matches.csv' WITH CSV HEADER
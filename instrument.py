@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+# instrument.py -- logging and call metrics for the tournament project
+# This file holds the 'tournament' logger and records, for every call to a
+# public function in tournament.py, how long it took, how many SQL statements
+# it ran, how many rows it fetched and how long it waited for a connection.
+#
+# Nothing is printed unless logging is configured, e.g. with
+#   logging.basicConfig(level=logging.INFO)
+
+import functools
+import logging
+import threading
+import time
+
+log = logging.getLogger('tournament')
+log.addHandler(logging.NullHandler())
+
+# The counters a backend reports for the current thread, see
+# storage.Backend.counters().
+COUNTERS = ('statements', 'rows', 'wait')
+
+_metrics = {}
+_metricsLock = threading.Lock()
+_hooks = []
+
+
+def addHook(hook):
+    """Calls hook(name, call) after every instrumented call.
+
+    Args:   hook:  A callable.  name is the function's name and call is a
+                dictionary with the call's seconds, statements, rows, wait
+                and whether it raised an error.
+    """
+    _hooks.append(hook)
+
+
+def removeHook(hook):
+    """Stops calling a hook passed to addHook()."""
+    _hooks.remove(hook)
+
+
+def metricsSnapshot():
+    """Returns the totals recorded for each function so far.
+
+    Returns:  A dictionary mapping each function's name to a dictionary of
+                calls, errors, seconds, maxSeconds, statements, rows and
+                wait (seconds spent waiting for a connection).
+    """
+    with _metricsLock:
+        return dict((name, dict(totals)) for name, totals in _metrics.items())
+
+
+def resetMetrics():
+    """Forgets every total recorded so far."""
+    with _metricsLock:
+        _metrics.clear()
+
+
+def _record(name, call):
+    """Adds one call to the totals and passes it to the hooks."""
+    with _metricsLock:
+        totals = _metrics.get(name)
+        if totals is None:
+            totals = _metrics[name] = {'calls': 0, 'errors': 0, 'seconds': 0.0,
+                                       'maxSeconds': 0.0, 'statements': 0,
+                                       'rows': 0, 'wait': 0.0}
+        totals['calls'] += 1
+        totals['errors'] += call['error']
+        totals['seconds'] += call['seconds']
+        totals['maxSeconds'] = max(totals['maxSeconds'], call['seconds'])
+        for counter in COUNTERS:
+            totals[counter] += call[counter]
+    for hook in list(_hooks):
+        hook(name, call)
+
+
+def instrumented(counters):
+    """Returns a decorator that records metrics for every call.
+
+    Args:   counters:  A callable returning the current thread's counters as
+                a dictionary with the keys in COUNTERS.
+    """
+    def decorate(function):
+        name = function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            before = counters()
+            start = time.time()
+            error = True
+            try:
+                result = function(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                seconds = time.time() - start
+                after = counters()
+                call = {'seconds': seconds, 'error': error}
+                for counter in COUNTERS:
+                    call[counter] = after[counter] - before[counter]
+                _record(name, call)
+                log.debug('%s took %.6fs, %d statements, %d rows, %.6fs '
+                          'waiting for a connection', name, seconds,
+                          call['statements'], call['rows'], call['wait'])
+        return wrapper
+    return decorate
@@ -0,0 +1,652 @@
+#!/usr/bin/env python
+
+# pgstorage.py -- PostgreSQL storage backend for the tournament project
+# This file implements the storage.Backend interface on top of the database
+# created by tournament.sql.
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from StringIO import StringIO
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+
+import swiss
+from storage import (DELETE_ALL_PLAYERS_SQL, LOCK_PLAYER_IDS_SQL,
+                     MATCH_COLUMNS, NEW_PLAYER_IDS_SQL, PLAYER_COLUMNS,
+                     REPORT_MATCHES_SQL, SYNC_PLAYER_IDS_SQL,
+                     TAKEN_PLAYER_ID_SQL, Backend, explicitPlayerIDs)
+
+# Numbers the named cursors opened by PostgresBackend._iterQuery().
+_cursorNumbers = itertools.count(1)
+
+
+def connect(dsn):
+    """Connect to the PostgreSQL database.
+
+    Returns: a database connection.
+    """
+    return psycopg2.connect(dsn)
+
+
+def _copyText(value):
+    """Formats a value as a field of a PostgreSQL COPY text row."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _syncPlayerIDs(db_cursor, atLeast=0):
+    """Moves the player id sequence past every id already in use.
+
+    Players registered with an explicit id do not advance the serial
+    sequence, so this keeps later registrations from being handed an id that
+    is already taken, by this database or, when it is a shard, by another
+    shard.  See SYNC_PLAYER_IDS_SQL in storage.py.
+
+    Args:   db_cursor:  A cursor on the current transaction.
+            atLeast:  An id the sequence must also be moved past, such as the
+                largest explicit id about to be inserted.
+    """
+    db_cursor.execute(SYNC_PLAYER_IDS_SQL % {'atLeast': '%s'}, (atLeast,))
+
+
+def _checkPlayerIDs(db_cursor, candidates, args=None):
+    """Raises ValueError if a player id about to be inserted is taken.
+
+    Player ids are unique across every tournament, as they are in
+    storage.MemoryBackend.  The check holds a lock until the transaction
+    ends, so two transactions can not both insert the same id.
+
+    Args:   db_cursor:  A cursor on the current transaction.
+            candidates:  A query selecting the new ids as a column named id.
+            args:  Optional arguments for the query.
+    """
+    db_cursor.execute(LOCK_PLAYER_IDS_SQL)
+    db_cursor.execute(TAKEN_PLAYER_ID_SQL % {'candidates': candidates}, args)
+    taken = db_cursor.fetchone()
+    if taken is not None:
+        raise ValueError("Player id %s is already taken." % taken[0])
+
+
+class _CountingCursor(psycopg2.extensions.cursor):
+    """A cursor that tells its backend about every statement and row."""
+
+    def execute(self, query, vars=None):
+        self.backend._count('statements', 1)
+        return super(_CountingCursor, self).execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        self.backend._count('statements', 1)
+        return super(_CountingCursor, self).executemany(query, vars_list)
+
+    def copy_from(self, *args, **kwargs):
+        self.backend._count('statements', 1)
+        return super(_CountingCursor, self).copy_from(*args, **kwargs)
+
+    def copy_expert(self, *args, **kwargs):
+        self.backend._count('statements', 1)
+        return super(_CountingCursor, self).copy_expert(*args, **kwargs)
+
+    def fetchone(self):
+        row = super(_CountingCursor, self).fetchone()
+        if row is not None:
+            self.backend._count('rows', 1)
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        rows = super(_CountingCursor, self).fetchmany(size)
+        self.backend._count('rows', len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super(_CountingCursor, self).fetchall()
+        self.backend._count('rows', len(rows))
+        return rows
+
+
+class PostgresBackend(Backend):
+    """Stores players and matches in the database created by tournament.sql.
+
+    Connections are borrowed from a thread-safe pool that is opened on first
+    use.  Once maxconn connections are in use, callers wait for one to be
+    returned.
+
+    Args:   dsn:  libpq connection string, e.g. 'dbname=tournament'.
+            minconn:  Number of connections the pool keeps open.
+            maxconn:  Most connections the pool will open at once.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = None
+        self._poolSlots = None
+        self._poolLock = threading.Lock()
+        self._local = threading.local()
+
+    def _getPool(self):
+        """Returns the connection pool, opening it on first use."""
+        with self._poolLock:
+            if self._pool is None:
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    self.minconn, self.maxconn, self.dsn)
+                self._poolSlots = threading.BoundedSemaphore(self.maxconn)
+            return self._pool, self._poolSlots
+
+    def close(self):
+        with self._poolLock:
+            if self._pool is not None:
+                self._pool.closeall()
+            self._pool = None
+            self._poolSlots = None
+
+    @contextmanager
+    def _connection(self):
+        """Borrows a connection from the pool for the length of a block."""
+        pool, slots = self._getPool()
+        start = time.time()
+        slots.acquire()
+        try:
+            db = pool.getconn()
+            self._count('wait', time.time() - start)
+            try:
+                yield db
+            finally:
+                pool.putconn(db)
+        finally:
+            slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """Runs a block of work in one transaction on a pooled connection.
+
+        Returns:  A cursor on the transaction's connection.
+        """
+        db_cursor = getattr(self._local, 'cursor', None)
+        if db_cursor is not None:
+            yield db_cursor
+            return
+        with self._connection() as db:
+            self._local.cursor = db.cursor(cursor_factory=_CountingCursor)
+            self._local.cursor.backend = self
+            try:
+                yield self._local.cursor
+            except BaseException:
+                db.rollback()
+                raise
+            else:
+                db.commit()
+            finally:
+                self._local.cursor = None
+
+    def _count(self, counter, amount):
+        if not hasattr(self._local, 'counters'):
+            self._local.counters = {'statements': 0, 'rows': 0, 'wait': 0.0}
+        self._local.counters[counter] += amount
+
+    def counters(self):
+        return dict(getattr(self._local, 'counters',
+                            {'statements': 0, 'rows': 0, 'wait': 0.0}))
+
+    def deleteMatches(self, tournament='blnk'):
+        with self.transaction() as db_cursor:
+            if tournament == 'blnk':
+                db_cursor.execute("SELECT clear_matches()")
+            else:
+                db_cursor.execute("SELECT clear_matches(%s)", (tournament,))
+
+    def deletePlayers(self, playerID='blnk'):
+        with self.transaction() as db_cursor:
+            if playerID == 'blnk':
+                for query in DELETE_ALL_PLAYERS_SQL:
+                    db_cursor.execute(query)
+            else:
+                query = "DELETE FROM players WHERE id = %s"
+                db_cursor.execute(query, (playerID,))
+
+    def countPlayers(self, tournament='blnk'):
+        with self.transaction() as db_cursor:
+            if tournament == 'blnk':
+                query = "SELECT count(*) FROM players WHERE id <> 0"
+                db_cursor.execute(query)
+            else:
+                query = "SELECT count(*) FROM players WHERE tournament = %s AND id <> 0"
+                db_cursor.execute(query, (tournament,))
+            return db_cursor.fetchone()[0]
+
+    def registerPlayer(self, tournament, name):
+        with self.transaction() as db_cursor:
+            db_cursor.execute("SELECT create_tournament(%s)", (tournament,))
+            query = "INSERT INTO players (tournament, name) VALUES (%s, %s) RETURNING id"
+            db_cursor.execute(query, (tournament, name,))
+            return db_cursor.fetchone()[0]
+
+    def registerPlayers(self, tournament, players):
+        """Streams the players into the players table with COPY.
+
+        Ids for new players are taken from the id sequence in one query, and
+        the sequence is moved past any explicit ids first so later
+        registrations never collide with them.  An explicit id already used
+        in any tournament is refused.
+        """
+        with self.transaction() as db_cursor:
+            db_cursor.execute("SELECT create_tournament(%s)", (tournament,))
+            explicitIDs = explicitPlayerIDs(players)
+            if explicitIDs:
+                _checkPlayerIDs(db_cursor, "SELECT unnest(%s) AS id",
+                                (explicitIDs,))
+                _syncPlayerIDs(db_cursor, max(explicitIDs))
+            needIDs = len(players) - len(explicitIDs)
+            db_cursor.execute(NEW_PLAYER_IDS_SQL % {'count': '%s'},
+                              (needIDs,))
+            newIDs = iter([row[0] for row in db_cursor.fetchall()])
+            ids = [newIDs.next() if playerID is None else playerID
+                   for playerID, name in players]
+            rows = StringIO()
+            for playerID, (ignored, name) in zip(ids, players):
+                rows.write('\t'.join(_copyText(field)
+                                     for field in (tournament, playerID, name)))
+                rows.write('\n')
+            rows.seek(0)
+            db_cursor.copy_from(rows, 'players',
+                                columns=('tournament', 'id', 'name'))
+        return ids
+
+    def reportMatches(self, rows):
+        """Upserts every match with a single multi-row insert.
+
+        The round lock of each tournament is taken in shared mode first, so
+        any number of submissions can run at once while lockRounds() waits
+        for them.  The round of a new match is read from the rounds table or
+        the players' standings in the same statement.
+        """
+        query = REPORT_MATCHES_SQL % {'reported': '(VALUES %s)'}
+        with self.transaction() as db_cursor:
+            for tournament in sorted(set(row[0] for row in rows)):
+                db_cursor.execute(
+                    "SELECT pg_advisory_xact_lock_shared(hashtext('rounds ' || %s))",
+                    (tournament,))
+            psycopg2.extras.execute_values(db_cursor, query, rows,
+                                           page_size=len(rows))
+            if db_cursor.rowcount < len(rows):
+                raise ValueError("A player has already played the same "
+                                 "opponent in an earlier round.")
+
+    def lockRounds(self, tournament):
+        """Waits for every submission to the tournament to commit.
+
+        The round lock is taken in exclusive mode and held until the
+        transaction ends, so new submissions wait in turn.
+        """
+        with self.transaction() as db_cursor:
+            db_cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('rounds ' || %s))",
+                (tournament,))
+
+    def roundState(self, tournament):
+        with self.transaction() as db_cursor:
+            db_cursor.execute("""
+                SELECT rounds.round, rounds.status, rounds.tables,
+                       (SELECT count(*) FROM games
+                        WHERE games.tournament = rounds.tournament
+                        AND games.round = rounds.round)
+                FROM rounds
+                WHERE rounds.tournament = %s
+                ORDER BY rounds.round DESC
+                LIMIT 1
+                """, (tournament,))
+            latest = db_cursor.fetchone() or (0, None, 0, 0)
+            db_cursor.execute("""
+                SELECT COALESCE(max(round), 0) FROM games WHERE tournament = %s
+                """, (tournament,))
+            played = db_cursor.fetchone()[0]
+        return dict(zip(('round', 'status', 'tables', 'reported'), latest),
+                    played=played)
+
+    def openRound(self, tournament, number, tables):
+        with self.transaction() as db_cursor:
+            db_cursor.execute("""
+                INSERT INTO rounds (tournament, round, tables)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (tournament, round) DO UPDATE
+                SET status = 'open', tables = EXCLUDED.tables
+                """, (tournament, number, tables))
+
+    def closeRound(self, tournament, number):
+        with self.transaction() as db_cursor:
+            db_cursor.execute("""
+                UPDATE rounds SET status = 'closed'
+                WHERE tournament = %s AND round = %s
+                """, (tournament, number))
+
+    def playerStandings(self, tournament='blnk'):
+        with self.transaction() as db_cursor:
+            query = "SELECT id, name, wins, matches FROM standings"
+            fromTournament = " WHERE tournament = %s"
+            byWins = " ORDER BY wins DESC, omw DESC"
+            if tournament == 'blnk':
+                db_cursor.execute(query + byWins)
+            else:
+                db_cursor.execute(query + fromTournament + byWins, (tournament,))
+            return db_cursor.fetchall()
+
+    def pairingSnapshot(self, tournament='blnk'):
+        with self.transaction() as db_cursor:
+            getStandings = "SELECT id, name, wins, omw FROM standings"
+            getHistory = "SELECT player_a, player_b, outcome FROM games"
+            fromTournament = " WHERE tournament = %s"
+            inStandingsOrder = " ORDER BY wins DESC, omw DESC"
+            if tournament == 'blnk':
+                db_cursor.execute(getStandings + inStandingsOrder)
+                standings = db_cursor.fetchall()
+                db_cursor.execute(getHistory)
+            else:
+                db_cursor.execute(getStandings + fromTournament + inStandingsOrder,
+                                  (tournament,))
+                standings = db_cursor.fetchall()
+                db_cursor.execute(getHistory + fromTournament, (tournament,))
+            history = swiss.historyRows(db_cursor.fetchall())
+        return standings, history
+
+    def createTournament(self, tournament):
+        with self.transaction() as db_cursor:
+            db_cursor.execute("SELECT create_tournament(%s)", (tournament,))
+            return db_cursor.fetchone()[0]
+
+    def purgeTournament(self, tournament, archive=False):
+        """Detaches the tournament's partitions and drops or renames them."""
+        with self.transaction() as db_cursor:
+            db_cursor.execute("SELECT purge_tournament(%s, %s)",
+                              (tournament, archive))
+
+    def rebuildStandings(self, tournament='blnk'):
+        with self.transaction() as db_cursor:
+            if tournament == 'blnk':
+                db_cursor.execute("SELECT rebuild_standings()")
+            else:
+                db_cursor.execute("SELECT rebuild_standings(%s)", (tournament,))
+
+    def _iterQuery(self, query, args, fetchSize):
+        """Yields the rows of a query from a named server-side cursor.
+
+        Only fetchSize rows are held in memory at a time.  The cursor runs in
+        a read-only transaction on a pooled connection of its own, which is
+        returned once the generator is exhausted or closed, so writes made
+        while iterating use the thread's own transaction and are committed
+        as usual.  The rows are those committed when iteration began.
+        """
+        with self._connection() as db:
+            try:
+                db.cursor().execute("SET TRANSACTION READ ONLY")
+                named = db.cursor(name='tournament_%d' % next(_cursorNumbers),
+                                  cursor_factory=_CountingCursor)
+                named.backend = self
+                named.execute(query, args)
+                while True:
+                    rows = named.fetchmany(fetchSize)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
+            finally:
+                # Ending the transaction closes the server-side cursor too.
+                db.rollback()
+
+    def iterStandings(self, tournament='blnk', fetchSize=1000):
+        query = "SELECT id, name, wins, matches FROM standings"
+        fromTournament = " WHERE tournament = %s"
+        byWins = " ORDER BY wins DESC, omw DESC"
+        if tournament == 'blnk':
+            return self._iterQuery(query + byWins, None, fetchSize)
+        return self._iterQuery(query + fromTournament + byWins, (tournament,),
+                               fetchSize)
+
+    def iterResults(self, tournament='blnk', fetchSize=1000):
+        query = "SELECT * FROM v_results"
+        fromTournament = " WHERE tournament = %s"
+        inEntryOrder = " ORDER BY entry"
+        if tournament == 'blnk':
+            return self._iterQuery(query + inEntryOrder, None, fetchSize)
+        return self._iterQuery(query + fromTournament + inEntryOrder,
+                               (tournament,), fetchSize)
+
+    def exportTournament(self, tournament, playersFile, matchesFile):
+        """Streams the players and matches out with COPY ... TO STDOUT."""
+        getPlayers = "SELECT %s FROM players WHERE id <> 0" % ', '.join(
+            PLAYER_COLUMNS)
+        getMatches = "SELECT %s FROM games" % ', '.join(MATCH_COLUMNS)
+        with self.transaction() as db_cursor:
+            if tournament == 'blnk':
+                getMatches += " ORDER BY entry"
+            else:
+                getPlayers += db_cursor.mogrify(" AND tournament = %s",
+                                                (tournament,))
+                getMatches += db_cursor.mogrify(
+                    " WHERE tournament = %s ORDER BY entry", (tournament,))
+            db_cursor.copy_expert("COPY (%s ORDER BY id) TO STDOUT WITH CSV "
+                                  "HEADER" % getPlayers, playersFile)
+            db_cursor.copy_expert("COPY (%s) TO STDOUT WITH CSV HEADER"
+                                  % getMatches, matchesFile)
+
+    def importTournament(self, playersFile, matchesFile):
+        """Streams the players and matches in with COPY ... FROM STDIN.
+
+        The players are copied into a temporary table first, so the
+        partitions of their tournaments can be created before they are
+        inserted.  The player id sequence is moved past the imported ids.
+        """
+        with self.transaction() as db_cursor:
+            db_cursor.execute("""
+                CREATE TEMPORARY TABLE imported_players
+                (LIKE players INCLUDING DEFAULTS) ON COMMIT DROP
+                """)
+            db_cursor.copy_expert("COPY imported_players (%s) FROM STDIN WITH "
+                                  "CSV HEADER" % ', '.join(PLAYER_COLUMNS),
+                                  playersFile)
+            db_cursor.execute("""
+                SELECT create_tournament(tournament)
+                FROM (SELECT DISTINCT tournament FROM imported_players)
+                AS tournaments
+                """)
+            _checkPlayerIDs(db_cursor, "SELECT id FROM imported_players")
+            columns = ', '.join(PLAYER_COLUMNS)
+            db_cursor.execute("INSERT INTO players (%s) SELECT %s FROM "
+                              "imported_players" % (columns, columns))
+            _syncPlayerIDs(db_cursor)
+            db_cursor.copy_expert("COPY games (%s) FROM STDIN WITH CSV HEADER"
+                                  % ', '.join(MATCH_COLUMNS), matchesFile)
+
+
+def _lsnKey(lsn):
+    """Returns a sortable key for a WAL position such as '16/B374D848'."""
+    high, low = lsn.split('/')
+    return (int(high, 16), int(low, 16))
+
+
+class ReplicatedBackend(Backend):
+    """Sends writes to a primary database and reads to its replicas.
+
+    Standings, player counts, pairing snapshots, streamed reads and exports
+    are read from the replicas in turn.  Everything else, including the
+    round state swissPairings() checks under its lock, uses the primary.
+    Reads inside a transaction() block that has already written go to the
+    primary too, since the replicas can not see its changes.
+
+    With readYourWrites, a read waits until its replica has replayed every
+    write made through this backend, so a scoreboard never shows standings
+    older than the last reportMatch() of the same process, and the standings
+    cache in tournament.py never keeps them.  A read inside a transaction
+    waits for everything the primary has committed, so the pairing snapshot
+    swissPairings() takes after its round lock still sees every submission.
+    A replica that has not caught up within maxWait seconds is skipped and
+    the read goes to the primary.
+
+    Args:   primary:  The PostgresBackend of the primary database.
+            replicas:  A list of PostgresBackends of its streaming replicas.
+            readYourWrites:  Whether reads wait for earlier writes.
+            maxWait:  The most seconds a read waits for a replica.
+    """
+
+    def __init__(self, primary, replicas, readYourWrites=True, maxWait=1.0):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.readYourWrites = readYourWrites
+        self.maxWait = maxWait
+        self._turns = itertools.count()
+        self._lastWrite = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def transaction(self):
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            self._local.wrote = False
+        self._local.depth = depth + 1
+        try:
+            with self.primary.transaction() as db_cursor:
+                yield db_cursor
+        finally:
+            self._local.depth = depth
+        if not depth and self._local.wrote and self.readYourWrites:
+            self._noteWrite(self._primaryPosition())
+
+    @contextmanager
+    def _writing(self):
+        """Runs a write on the primary and notes that it happened."""
+        with self.transaction():
+            self._local.wrote = True
+            yield self.primary
+
+    def _primaryPosition(self):
+        """Returns the primary's current WAL position."""
+        with self.primary.transaction() as db_cursor:
+            db_cursor.execute("SELECT pg_current_wal_lsn()::text")
+            return db_cursor.fetchone()[0]
+
+    def _noteWrite(self, lsn):
+        with self._lock:
+            if self._lastWrite is None or _lsnKey(lsn) > _lsnKey(self._lastWrite):
+                self._lastWrite = lsn
+
+    def _reader(self):
+        """Returns the backend the next read should go to."""
+        if not self.replicas:
+            return self.primary
+        if getattr(self._local, 'depth', 0):
+            if self._local.wrote:
+                return self.primary
+            lsn = self._primaryPosition()
+        elif self.readYourWrites:
+            with self._lock:
+                lsn = self._lastWrite
+        else:
+            lsn = None
+        replica = self.replicas[next(self._turns) % len(self.replicas)]
+        if lsn is None or self._caughtUp(replica, lsn):
+            return replica
+        return self.primary
+
+    def _caughtUp(self, replica, lsn):
+        """Waits up to maxWait seconds for a replica to replay a position."""
+        deadline = time.time() + self.maxWait
+        with replica.transaction() as db_cursor:
+            while True:
+                db_cursor.execute(
+                    "SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn", (lsn,))
+                if db_cursor.fetchone()[0]:
+                    return True
+                if time.time() >= deadline:
+                    return False
+                time.sleep(0.005)
+
+    def close(self):
+        self.primary.close()
+        for replica in self.replicas:
+            replica.close()
+
+    def counters(self):
+        totals = self.primary.counters()
+        for replica in self.replicas:
+            for counter, amount in replica.counters().items():
+                totals[counter] += amount
+        return totals
+
+    def deleteMatches(self, tournament='blnk'):
+        with self._writing() as primary:
+            primary.deleteMatches(tournament)
+
+    def deletePlayers(self, playerID='blnk'):
+        with self._writing() as primary:
+            primary.deletePlayers(playerID)
+
+    def countPlayers(self, tournament='blnk'):
+        return self._reader().countPlayers(tournament)
+
+    def registerPlayer(self, tournament, name):
+        with self._writing() as primary:
+            return primary.registerPlayer(tournament, name)
+
+    def registerPlayers(self, tournament, players):
+        with self._writing() as primary:
+            return primary.registerPlayers(tournament, players)
+
+    def reportMatches(self, rows):
+        with self._writing() as primary:
+            primary.reportMatches(rows)
+
+    def lockRounds(self, tournament):
+        self.primary.lockRounds(tournament)
+
+    def roundState(self, tournament):
+        return self.primary.roundState(tournament)
+
+    def openRound(self, tournament, number, tables):
+        with self._writing() as primary:
+            primary.openRound(tournament, number, tables)
+
+    def closeRound(self, tournament, number):
+        with self._writing() as primary:
+            primary.closeRound(tournament, number)
+
+    def playerStandings(self, tournament='blnk'):
+        return self._reader().playerStandings(tournament)
+
+    def pairingSnapshot(self, tournament='blnk'):
+        return self._reader().pairingSnapshot(tournament)
+
+    def rebuildStandings(self, tournament='blnk'):
+        with self._writing() as primary:
+            primary.rebuildStandings(tournament)
+
+    def createTournament(self, tournament):
+        with self._writing() as primary:
+            return primary.createTournament(tournament)
+
+    def purgeTournament(self, tournament, archive=False):
+        with self._writing() as primary:
+            primary.purgeTournament(tournament, archive)
+
+    def iterStandings(self, tournament='blnk', fetchSize=1000):
+        return self._reader().iterStandings(tournament, fetchSize)
+
+    def iterResults(self, tournament='blnk', fetchSize=1000):
+        return self._reader().iterResults(tournament, fetchSize)
+
+    def exportTournament(self, tournament, playersFile, matchesFile):
+        self._reader().exportTournament(tournament, playersFile, matchesFile)
+
+    def importTournament(self, playersFile, matchesFile):
+        with self._writing() as primary:
+            primary.importTournament(playersFile, matchesFile)
@@ -2,8 +2,8 @@
 
 import random
 
-from tournament import connect
-from tournament import reportMatch
+from tournament import registerPlayers
+from tournament import reportRound
 from tournament import swissPairings
 
 from tournament_test import testDelete
@@ -34,29 +34,27 @@ theResults = [
 def registerPlayerUpdated(tournament, id, name):
     """Add a player to the tournament database.
 
-	This calls registerPlayer and adds the ability to set the players ID.
+	This calls registerPlayers and adds the ability to set the players ID.
 
     Args:
       tournament:  A three character code assigned to each tournament.
 			  id:  Establish the ID for player.  This NEEDS to be a unique value.
             name:  The player's full name.  This does not need to be a uniue value.
     """
-    db = connect()
-    db_cursor = db.cursor()
-    query = "INSERT INTO players (tournament, id, name) VALUES (%s, %s, %s)"
-    db_cursor.execute(query, (tournament, id, name,))
-    print '==>  ' + name + ' has been registered for tournament: ' + tournament
-    db.commit()
-    db.close()
+    registerPlayers(tournament, [(id, name)])
 
 
 def signUps(listOfPlayers):
     """Register a list of players to their individually assigned tournament.
 
+	Players are registered in bulk, one call to registerPlayers per
+	tournament.
     """
+    tournaments = {}
     for player in listOfPlayers:
-        registerPlayerUpdated(player[0], player[1], player[2],)
-        print '==>  ' + player[2] + ' registered to tournament ' + player[0] + '.'
+        tournaments.setdefault(player[0], []).append((player[1], player[2]))
+    for tournament, players in sorted(tournaments.items()):
+        registerPlayers(tournament, players)
 
 
 def roundOfSwiss(tournament):
@@ -66,22 +64,26 @@ def roundOfSwiss(tournament):
 
     """
     matches = swissPairings(tournament)
+    results = []
     if matches[0][2] == 0:
         byeRound = matches[0]
-        reportMatch(tournament, byeRound[0], 0, 'win')
+        results.append((byeRound[0], 0, 'win'))
         del matches[0]
     for match in matches:
         result = random.choice(theResults)
-        reportMatch(tournament, match[0], match[2], result)
+        results.append((match[0], match[2], result))
+    reportRound(tournament, results)
     print '==>  Round of Swiss complete!'
 
-# Delete Players and matches
-testDelete()
 
-# Register a list of players.
-signUps(thePlayers)
+if __name__ == '__main__':
+    # Delete Players and matches
+    testDelete()
 
-# Player some rounds using the Swiss Tournament system
-roundOfSwiss('WOW')
-roundOfSwiss('WOW')
-roundOfSwiss('WOW')
+    # Register a list of players.
+    signUps(thePlayers)
+
+    # Player some rounds using the Swiss Tournament system
+    roundOfSwiss('WOW')
+    roundOfSwiss('WOW')
+    roundOfSwiss('WOW')
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+
+# service.py -- long-running HTTP/JSON service for the tournament project
+# This file serves the functions in tournament.py over HTTP so event
+# front-ends can call one warm process, with its connection pool and
+# standings cache already open, instead of starting Python for every
+# request.  Results submitted at about the same time are committed together
+# in one transaction.
+#
+# Examples:
+#   python service.py --port 8000
+#   curl -d '{"names": ["Rich Guy", "Poor Guy"]}' localhost:8000/tournaments/ABC/players
+#   curl -d '{"results": [[1, 2, "win"]]}' localhost:8000/tournaments/ABC/results
+#   curl localhost:8000/tournaments/ABC/standings
+
+import argparse
+import json
+import logging
+import Queue
+import re
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import storage
+import swiss
+import tournament
+
+log = tournament.log
+
+
+class _Submission(object):
+    """One caller's results, waiting to be committed."""
+
+    def __init__(self, code, results):
+        self.code = code
+        self.results = results
+        self.error = None
+        self.done = threading.Event()
+
+
+class ResultBatcher(object):
+    """Commits results from many callers in shared transactions.
+
+    A single writer thread takes the submissions queued within window
+    seconds of each other, up to maxBatch of them, and reports them all in
+    one transaction, so a burst of results costs one commit instead of one
+    each.  If the shared transaction fails, the submissions are committed
+    one at a time so that only the one at fault gets the error.
+
+    Args:   window:  Seconds to wait for more submissions after the first.
+            maxBatch:  The most submissions committed together.
+    """
+
+    def __init__(self, window=0.002, maxBatch=100):
+        self.window = window
+        self.maxBatch = maxBatch
+        self.batches = 0
+        self.submissions = 0
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, code, results):
+        """Reports a round of results and returns once they are committed.
+
+        Args:   code:  A three character code assigned to each tournament.
+                results:  A list of (playerID, opponent, result) tuples, as
+                    taken by tournament.reportRound().
+
+        Raises:   ValueError if the results are invalid or can not be
+                    recorded.
+        """
+        # Bad input is turned away before it can hold up anyone else's batch.
+        swiss.resultRows(code, results)
+        submission = _Submission(code, results)
+        self._queue.put(submission)
+        submission.done.wait()
+        if submission.error is not None:
+            raise submission.error
+
+    def close(self):
+        """Commits everything queued so far and stops the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            submission = self._queue.get()
+            if submission is None:
+                return
+            batch = [submission]
+            deadline = time.time() + self.window
+            while len(batch) < self.maxBatch:
+                try:
+                    submission = self._queue.get(
+                        timeout=max(deadline - time.time(), 0))
+                except Queue.Empty:
+                    break
+                if submission is None:
+                    # Stop once this batch is committed.
+                    self._queue.put(None)
+                    break
+                batch.append(submission)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        """Commits a batch, one submission at a time if it fails together."""
+        try:
+            with tournament.transaction():
+                for submission in batch:
+                    tournament.reportRound(submission.code, submission.results)
+        except Exception as error:
+            if len(batch) == 1:
+                batch[0].error = error
+            else:
+                log.info('A batch of %s submissions failed (%s); committing '
+                         'them one at a time.', len(batch), error)
+                for submission in batch:
+                    try:
+                        tournament.reportRound(submission.code,
+                                               submission.results)
+                    except Exception as error:
+                        submission.error = error
+        self.batches += 1
+        self.submissions += len(batch)
+        for submission in batch:
+            submission.done.set()
+
+
+class TournamentHandler(BaseHTTPRequestHandler):
+    """Answers the service's JSON requests.
+
+    GET  /tournaments/<code>/players    {"count": n}
+    POST /tournaments/<code>/players    {"names": [...]} -> {"ids": [...]}
+    POST /tournaments/<code>/results    {"results": [[id, opponent, result]]}
+    GET  /tournaments/<code>/standings  {"standings": [[id, name, wins, matches]]}
+    POST /tournaments/<code>/pairings   {"wait": seconds} -> {"pairings": [...]}
+    GET  /tournaments/<code>/round      the dictionary from roundStatus()
+    GET  /metrics                       call metrics, cache and batch totals
+
+    Use 'blnk' as the code to mean every tournament, as in tournament.py.
+    """
+
+    # Keep connections open between requests.
+    protocol_version = 'HTTP/1.1'
+
+    ROUTES = [
+        ('GET', re.compile(r'^/tournaments/(\w+)/players$'), 'countPlayers'),
+        ('POST', re.compile(r'^/tournaments/(\w+)/players$'), 'registerPlayers'),
+        ('POST', re.compile(r'^/tournaments/(\w+)/results$'), 'reportResults'),
+        ('GET', re.compile(r'^/tournaments/(\w+)/standings$'), 'playerStandings'),
+        ('POST', re.compile(r'^/tournaments/(\w+)/pairings$'), 'swissPairings'),
+        ('GET', re.compile(r'^/tournaments/(\w+)/round$'), 'roundStatus'),
+        ('GET', re.compile(r'^/metrics$'), 'metrics'),
+    ]
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        path = self.path.split('?', 1)[0]
+        for routeMethod, pattern, action in self.ROUTES:
+            match = pattern.match(path)
+            if match and routeMethod == method:
+                break
+        else:
+            return self._reply(404, {'error': 'No such resource: %s %s' %
+                                              (method, path)})
+        try:
+            body = self._body() if method == 'POST' else {}
+            reply = getattr(self, action)(body, *match.groups())
+        except (tournament.RoundIncomplete, tournament.NoValidPairing) as error:
+            return self._reply(409, {'error': str(error)})
+        except (ValueError, KeyError, TypeError) as error:
+            return self._reply(400, {'error': str(error)})
+        except Exception as error:
+            log.exception('%s %s failed.', method, path)
+            return self._reply(500, {'error': str(error)})
+        self._reply(200, reply)
+
+    def _body(self):
+        """Returns the request's JSON body as a dictionary."""
+        length = int(self.headers.getheader('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or '{}')
+        if not isinstance(body, dict):
+            raise ValueError('The request body must be a JSON object.')
+        return body
+
+    def _reply(self, status, reply):
+        text = json.dumps(reply)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, format, *args):
+        log.debug('%s - %s', self.address_string(), format % args)
+
+    def countPlayers(self, body, code):
+        return {'count': tournament.countPlayers(code)}
+
+    def registerPlayers(self, body, code):
+        return {'ids': tournament.registerPlayers(code, body['names'])}
+
+    def reportResults(self, body, code):
+        results = [tuple(result) for result in body['results']]
+        self.server.batcher.submit(code, results)
+        return {'reported': len(results)}
+
+    def playerStandings(self, body, code):
+        return {'standings': tournament.playerStandings(code)}
+
+    def swissPairings(self, body, code):
+        return {'pairings': tournament.swissPairings(code,
+                                                     body.get('wait', 0))}
+
+    def roundStatus(self, body, code):
+        return tournament.roundStatus(code)
+
+    def metrics(self, body):
+        return {
+            'functions': tournament.metricsSnapshot(),
+            'cache': tournament.cacheStats(),
+            'batches': {'batches': self.server.batcher.batches,
+                        'submissions': self.server.batcher.submissions},
+        }
+
+
+class TournamentServer(ThreadingMixIn, HTTPServer):
+    """Serves TournamentHandler on a thread per connection.
+
+    Args:   address:  A (host, port) tuple.  Port 0 picks a free port.
+            batcher:  Optional ResultBatcher for submitted results.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # Front-ends open many connections at once at the end of a round.
+    request_queue_size = 128
+
+    def __init__(self, address, batcher=None):
+        HTTPServer.__init__(self, address, TournamentHandler)
+        self.batcher = batcher or ResultBatcher()
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.batcher.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve the tournament functions over HTTP as JSON.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--backend', choices=['postgres', 'memory'],
+                        default=tournament.BACKEND)
+    parser.add_argument('--connections', type=int,
+                        default=tournament.MAX_CONNECTIONS,
+                        help='most database connections (default: %(default)s)')
+    parser.add_argument('--window', type=float, default=2.0,
+                        help='milliseconds to gather results into one commit '
+                             '(default: %(default)s)')
+    parser.add_argument('--batch', type=int, default=100,
+                        help='most submissions per commit (default: '
+                             '%(default)s)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.backend == 'memory':
+        tournament.useBackend(storage.MemoryBackend())
+    else:
+        tournament.configure(maxconn=args.connections)
+    # Open the first connection now rather than on the first request.
+    tournament.countPlayers()
+    server = TournamentServer((args.host, args.port),
+                              ResultBatcher(args.window / 1000.0, args.batch))
+    log.info('Serving tournaments on http://%s:%s/', *server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+# sharding.py -- spreads tournaments across several storage backends
+# This file implements the storage.Backend interface by routing the work for
+# each tournament to one of several backends, usually one PostgreSQL database
+# per shard, so that a busy event only loads the database it lives on.
+
+import bisect
+import csv
+import hashlib
+import heapq
+import sys
+import threading
+from contextlib import contextmanager
+from StringIO import StringIO
+
+from storage import MATCH_COLUMNS, PLAYER_COLUMNS, Backend
+
+
+def _hash(key):
+    """Returns a stable 32-bit hash of a string, the same in every process."""
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def _byWins(rows):
+    """Merges the standings of several shards into one standings order.
+
+    Args:   rows:  Each shard's (id, name, wins, omw) tuples in standings
+                order, as returned by pairingSnapshot().
+
+    Returns:  Every shard's tuples, ordered by wins and then by OMW.
+    """
+    keyed = [[(-row[2], -(row[3] or 0), shard, position, row)
+              for position, row in enumerate(shardRows)]
+             for shard, shardRows in enumerate(rows)]
+    return [key[4] for key in heapq.merge(*keyed)]
+
+
+class ShardedBackend(Backend):
+    """Keeps each tournament in one of several backends.
+
+    A tournament is stored on the shard it is assigned to, or otherwise on
+    the shard picked for its code by consistent hashing, so adding a shard
+    only moves about its share of the tournaments.  Work on one tournament
+    goes to its shard alone; work on every tournament ('blnk') goes to every
+    shard and the results are combined.
+
+    Players keep the ids their shard gives them, and deletePlayers() with a
+    player id is sent to every shard, so each shard must hand out ids that
+    no other shard uses, e.g. by giving each database's players_id_seq the
+    same INCREMENT BY and a different start.
+
+    A transaction() block joins a transaction on each shard it touches.
+    They are committed one after another when the block exits, not with a
+    two-phase commit, so a block that writes to several shards is not
+    atomic across them.
+
+    Args:   shards:  A dictionary of shard name to storage.Backend.
+            assignments:  Optional dictionary of tournament code to shard
+                name for tournaments placed by hand.
+            points:  How many points each shard has on the hash ring.  More
+                points spread the tournaments more evenly.
+    """
+
+    def __init__(self, shards, assignments=None, points=100):
+        if not shards:
+            raise ValueError("At least one shard is needed.")
+        self.shards = dict(shards)
+        self.assignments = dict(assignments or {})
+        for tournament, name in self.assignments.items():
+            if name not in self.shards:
+                raise ValueError("Tournament %s is assigned to unknown shard "
+                                 "%s." % (tournament, name))
+        self._ring = sorted((_hash('%s-%s' % (name, point)), name)
+                            for name in self.shards for point in range(points))
+        self._hashes = [point for point, name in self._ring]
+        self._local = threading.local()
+
+    def shardFor(self, tournament):
+        """Returns the name of the shard a tournament is kept on."""
+        if tournament == 'blnk':
+            raise ValueError("Every tournament is kept on every shard.")
+        name = self.assignments.get(tournament)
+        if name is None:
+            position = bisect.bisect(self._hashes, _hash(tournament))
+            name = self._ring[position % len(self._ring)][1]
+        return name
+
+    def _shard(self, tournament):
+        """Returns a tournament's backend, joined to any open transaction."""
+        return self._join(self.shards[self.shardFor(tournament)])
+
+    def _every(self):
+        """Returns every backend in name order, joined to any transaction."""
+        return [self._join(self.shards[name]) for name in sorted(self.shards)]
+
+    def _join(self, backend):
+        """Starts a transaction on a backend inside a transaction() block."""
+        opened = getattr(self._local, 'opened', None)
+        if opened is not None and \
+                not any(joined is backend for joined, manager in opened):
+            manager = backend.transaction()
+            manager.__enter__()
+            opened.append((backend, manager))
+        return backend
+
+    @contextmanager
+    def transaction(self):
+        if getattr(self._local, 'opened', None) is not None:
+            yield self
+            return
+        self._local.opened = []
+        try:
+            yield self
+        except BaseException:
+            self._finish(sys.exc_info())
+            raise
+        else:
+            error = self._finish((None, None, None))
+            if error is not None:
+                raise error
+
+    def _finish(self, excInfo):
+        """Commits, or after an error rolls back, every joined transaction.
+
+        Returns:  The first error raised while committing, if any; the
+                    shards after it are rolled back.
+        """
+        opened, self._local.opened = self._local.opened, None
+        error = None
+        for backend, manager in opened:
+            try:
+                manager.__exit__(*excInfo)
+            except Exception:
+                if error is None:
+                    error = sys.exc_info()[1]
+                    excInfo = sys.exc_info()
+        return error
+
+    def close(self):
+        for backend in self.shards.values():
+            backend.close()
+
+    def counters(self):
+        totals = {}
+        for backend in self.shards.values():
+            for counter, amount in backend.counters().items():
+                totals[counter] = totals.get(counter, 0) + amount
+        return totals
+
+    def deleteMatches(self, tournament='blnk'):
+        if tournament != 'blnk':
+            return self._shard(tournament).deleteMatches(tournament)
+        with self.transaction():
+            for backend in self._every():
+                backend.deleteMatches()
+
+    def deletePlayers(self, playerID='blnk'):
+        with self.transaction():
+            for backend in self._every():
+                backend.deletePlayers(playerID)
+
+    def countPlayers(self, tournament='blnk'):
+        if tournament != 'blnk':
+            return self._shard(tournament).countPlayers(tournament)
+        with self.transaction():
+            return sum(backend.countPlayers() for backend in self._every())
+
+    def registerPlayer(self, tournament, name):
+        return self._shard(tournament).registerPlayer(tournament, name)
+
+    def registerPlayers(self, tournament, players):
+        return self._shard(tournament).registerPlayers(tournament, players)
+
+    def reportMatches(self, rows):
+        shards = {}
+        for row in rows:
+            shards.setdefault(self.shardFor(row[0]), []).append(row)
+        with self.transaction():
+            for name in sorted(shards):
+                self._join(self.shards[name]).reportMatches(shards[name])
+
+    def lockRounds(self, tournament):
+        return self._shard(tournament).lockRounds(tournament)
+
+    def roundState(self, tournament):
+        return self._shard(tournament).roundState(tournament)
+
+    def openRound(self, tournament, number, tables):
+        return self._shard(tournament).openRound(tournament, number, tables)
+
+    def closeRound(self, tournament, number):
+        return self._shard(tournament).closeRound(tournament, number)
+
+    def playerStandings(self, tournament='blnk'):
+        if tournament != 'blnk':
+            return self._shard(tournament).playerStandings(tournament)
+        # The shards' standings are merged by OMW as well as wins, which
+        # only their pairing snapshots include.
+        standings, history = self.pairingSnapshot()
+        matches = {}
+        for row in history:
+            matches[row[0]] = matches.get(row[0], 0) + 1
+        return [(row[0], row[1], row[2], matches.get(row[0], 0))
+                for row in standings]
+
+    def pairingSnapshot(self, tournament='blnk'):
+        if tournament != 'blnk':
+            return self._shard(tournament).pairingSnapshot(tournament)
+        standings = []
+        history = []
+        with self.transaction():
+            for backend in self._every():
+                shardStandings, shardHistory = backend.pairingSnapshot()
+                standings.append(shardStandings)
+                history.extend(shardHistory)
+        return _byWins(standings), history
+
+    def rebuildStandings(self, tournament='blnk'):
+        if tournament != 'blnk':
+            return self._shard(tournament).rebuildStandings(tournament)
+        with self.transaction():
+            for backend in self._every():
+                backend.rebuildStandings()
+
+    def createTournament(self, tournament):
+        return self._shard(tournament).createTournament(tournament)
+
+    def purgeTournament(self, tournament, archive=False):
+        return self._shard(tournament).purgeTournament(tournament, archive)
+
+    def iterStandings(self, tournament='blnk', fetchSize=1000):
+        if tournament != 'blnk':
+            return self._shard(tournament).iterStandings(tournament,
+                                                         fetchSize)
+        # The shards' standings are merged, so they are read in full.
+        return iter(self.playerStandings())
+
+    def iterResults(self, tournament='blnk', fetchSize=1000):
+        if tournament != 'blnk':
+            return self._shard(tournament).iterResults(tournament, fetchSize)
+        return self._iterEvery(fetchSize)
+
+    def _iterEvery(self, fetchSize):
+        """Yields every shard's results, one shard after another."""
+        for name in sorted(self.shards):
+            for row in self.shards[name].iterResults('blnk', fetchSize):
+                yield row
+
+    def exportTournament(self, tournament, playersFile, matchesFile):
+        if tournament != 'blnk':
+            return self._shard(tournament).exportTournament(
+                tournament, playersFile, matchesFile)
+        with self.transaction():
+            for number, backend in enumerate(self._every()):
+                players = StringIO()
+                matches = StringIO()
+                backend.exportTournament('blnk', players, matches)
+                for output, exported in ((playersFile, players),
+                                         (matchesFile, matches)):
+                    exported.seek(0)
+                    if number:
+                        # Only the first shard's header row is kept.
+                        exported.readline()
+                    output.write(exported.read())
+
+    def importTournament(self, playersFile, matchesFile):
+        """Splits the files by shard and imports each shard's part."""
+        parts = {}
+        for columns, source, column in ((PLAYER_COLUMNS, playersFile, 0),
+                                        (MATCH_COLUMNS, matchesFile, 1)):
+            for row in csv.DictReader(source):
+                name = self.shardFor(row['tournament'])
+                if name not in parts:
+                    parts[name] = (StringIO(), StringIO())
+                    for part, header in zip(parts[name],
+                                            (PLAYER_COLUMNS, MATCH_COLUMNS)):
+                        csv.writer(part).writerow(header)
+                csv.writer(parts[name][column]).writerow(
+                    [row[key] for key in columns])
+        with self.transaction():
+            for name in sorted(parts):
+                players, matches = parts[name]
+                players.seek(0)
+                matches.seek(0)
+                self._join(self.shards[name]).importTournament(players,
+                                                               matches)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+# simulate.py -- Monte Carlo simulation of Swiss-system tournaments
+# This file plays complete events in memory, with the same pairing, bye and
+# tie-break rules as tournament.py, and spreads thousands of them across a
+# process pool to estimate how often each player finishes where, and how
+# often the pairings have to be aborted.  It is useful for choosing the
+# number of rounds and the size of the cut for an event.
+#
+# Examples:
+#   python simulate.py --players 64 --rounds 6 --simulations 10000
+#   python simulate.py --players 200 --model rating --cut 8
+
+import argparse
+import json
+import math
+import random
+from multiprocessing import Pool
+
+import storage
+import swiss
+
+# The tournament code simulated events are stored under.
+CODE = 'SIM'
+
+
+class RandomResults(object):
+    """Decides every match at random, regardless of the players.
+
+    Args:   tieRate:  The chance of a match being tied.
+    """
+
+    def __init__(self, tieRate=1.0 / 3):
+        self.tieRate = tieRate
+
+    def __call__(self, rng, rating, opponentRating):
+        roll = rng.random()
+        if roll < self.tieRate:
+            return 'tie'
+        if roll < self.tieRate + (1 - self.tieRate) / 2:
+            return 'win'
+        return 'lose'
+
+
+class RatingResults(object):
+    """Decides matches with the Elo expected score of the two players.
+
+    Args:   tieRate:  The chance of a match being tied.
+            scale:  Rating difference at which the stronger player is
+                expected to win ten times as often as they lose.
+    """
+
+    def __init__(self, tieRate=0.0, scale=400.0):
+        self.tieRate = tieRate
+        self.scale = scale
+
+    def __call__(self, rng, rating, opponentRating):
+        if rng.random() < self.tieRate:
+            return 'tie'
+        expected = 1.0 / (1 + 10 ** ((opponentRating - rating) / self.scale))
+        if rng.random() < expected:
+            return 'win'
+        return 'lose'
+
+
+# The result models that can be chosen from the command line.
+MODELS = {
+    'random': RandomResults,
+    'rating': RatingResults,
+}
+
+
+def defaultRatings(players):
+    """Returns evenly spread ratings from 1800 down to 1200, best first."""
+    if players == 1:
+        return [1500.0]
+    return [1800.0 - 600.0 * seed / (players - 1) for seed in range(players)]
+
+
+def roundsFor(players):
+    """Returns the usual number of Swiss rounds for a field of players."""
+    return max(1, int(math.ceil(math.log(players, 2))))
+
+
+def playEvent(ratings, rounds, model, rng):
+    """Plays one complete Swiss event in memory.
+
+    Args:   ratings:  A rating for every player, best seed first.  Players are
+                identified by their seed, starting at 1.
+            rounds:  The number of rounds to play.
+            model:  A result model, called as model(rng, rating,
+                opponentRating) and returning 'win', 'lose', or 'tie'.
+            rng:  A random.Random to draw results from.
+
+    Returns:  A tuple of (ranking, abortedRound) where ranking is the list of
+                seeds in final standings order and abortedRound is the first
+                round that could not be fully paired, or None.
+    """
+    backend = storage.MemoryBackend()
+    backend.registerPlayers(
+        CODE, [(seed, str(seed)) for seed in range(1, len(ratings) + 1)])
+    abortedRound = None
+    for number in range(1, rounds + 1):
+        standings, history = backend.pairingSnapshot(CODE)
+        pairs, aborted = swiss.pairRound(standings, history)
+        if aborted is not None and abortedRound is None:
+            abortedRound = number
+        results = []
+        for playerID, name, opponent, opponentName in pairs:
+            if opponent == 0:
+                results.append((playerID, 0, 'win'))
+            else:
+                results.append((playerID, opponent,
+                                model(rng, ratings[playerID - 1],
+                                      ratings[opponent - 1])))
+        backend.reportMatches(swiss.resultRows(CODE, results))
+    standings = backend.pairingSnapshot(CODE)[0]
+    return [row[0] for row in standings], abortedRound
+
+
+def _simulateBatch(task):
+    """Plays a batch of events and returns their combined statistics."""
+    ratings, rounds, model, simulations, seed = task
+    rng = random.Random(seed)
+    players = len(ratings)
+    rankCounts = [[0] * players for player in range(players)]
+    abortedRounds = {}
+    for simulation in range(simulations):
+        ranking, abortedRound = playEvent(ratings, rounds, model, rng)
+        for rank, playerID in enumerate(ranking):
+            rankCounts[playerID - 1][rank] += 1
+        if abortedRound is not None:
+            abortedRounds[abortedRound] = abortedRounds.get(abortedRound, 0) + 1
+    return rankCounts, abortedRounds
+
+
+def simulate(ratings, rounds=None, simulations=1000, model=None, processes=None,
+             seed=0, batchSize=50):
+    """Plays many independent events and aggregates their outcomes.
+
+    Args:   ratings:  A rating for every player, best seed first.
+            rounds:  The number of rounds per event.  Defaults to log2 of the
+                number of players.
+            simulations:  How many events to play.
+            model:  A result model such as RandomResults() or
+                RatingResults().  Defaults to RandomResults().
+            processes:  Size of the process pool.  Defaults to the number of
+                CPUs; 1 plays every event in this process.
+            seed:  Seed for the random results, so runs can be repeated.
+            batchSize:  Events each worker plays per task.
+
+    Returns:  A dictionary with:
+                simulations:  The number of events played.
+                rounds:  The number of rounds per event.
+                rankCounts:  rankCounts[seed - 1][rank - 1] is how many times
+                    that seed finished in that place.
+                abortRate:  The share of events in which a round could not be
+                    fully paired.
+                abortedRounds:  How many events first aborted in each round.
+    """
+    players = len(ratings)
+    rounds = rounds or roundsFor(players)
+    model = model or RandomResults()
+    tasks = []
+    for start in range(0, simulations, batchSize):
+        tasks.append((ratings, rounds, model,
+                      min(batchSize, simulations - start), seed + start))
+    if processes == 1:
+        batches = [_simulateBatch(task) for task in tasks]
+    else:
+        pool = Pool(processes)
+        try:
+            batches = pool.map(_simulateBatch, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    rankCounts = [[0] * players for player in range(players)]
+    abortedRounds = {}
+    for batchCounts, batchAborted in batches:
+        for player in range(players):
+            for rank in range(players):
+                rankCounts[player][rank] += batchCounts[player][rank]
+        for number, count in batchAborted.items():
+            abortedRounds[number] = abortedRounds.get(number, 0) + count
+    return {
+        'simulations': simulations,
+        'rounds': rounds,
+        'rankCounts': rankCounts,
+        'abortRate': sum(abortedRounds.values()) / float(simulations or 1),
+        'abortedRounds': abortedRounds,
+    }
+
+
+def cutRates(stats, cut):
+    """Returns how often each seed finished inside the top `cut` places."""
+    return [sum(counts[:cut]) / float(stats['simulations'] or 1)
+            for counts in stats['rankCounts']]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Simulate Swiss-system tournaments in memory.')
+    parser.add_argument('--players', type=int, default=32)
+    parser.add_argument('--rounds', type=int,
+                        help='rounds per event (default: log2 of players)')
+    parser.add_argument('--simulations', type=int, default=1000)
+    parser.add_argument('--model', choices=sorted(MODELS), default='random')
+    parser.add_argument('--tie-rate', type=float,
+                        help='chance of a tied match')
+    parser.add_argument('--cut', type=int, default=8,
+                        help='report how often each seed makes this cut')
+    parser.add_argument('--processes', type=int,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    model = MODELS[args.model]()
+    if args.tie_rate is not None:
+        model.tieRate = args.tie_rate
+    stats = simulate(defaultRatings(args.players), args.rounds,
+                     args.simulations, model, args.processes, args.seed)
+    print(json.dumps({
+        'players': args.players,
+        'rounds': stats['rounds'],
+        'simulations': stats['simulations'],
+        'model': args.model,
+        'abortRate': stats['abortRate'],
+        'abortedRounds': stats['abortedRounds'],
+        'cut': args.cut,
+        'cutRates': cutRates(stats, args.cut),
+    }, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,633 @@
+#!/usr/bin/env python
+
+# storage.py -- storage backends for the tournament project
+# This file defines the interface tournament.py uses to store players and
+# matches, and a pure Python implementation of it that keeps everything in
+# memory.  The PostgreSQL implementation is in pgstorage.py.
+
+import csv
+import threading
+from contextlib import contextmanager
+
+import swiss
+
+# The columns of the CSV files written by exportTournament().
+PLAYER_COLUMNS = ('tournament', 'id', 'name')
+MATCH_COLUMNS = ('tournament', 'round', 'player_a', 'player_b', 'outcome')
+
+# Upserts reported matches into the games table of tournament.sql, for
+# pgstorage.py and tournament_async.py.  %(reported)s is replaced with the
+# driver's way of passing (tournament, player_a, player_b, outcome) rows.
+# A match already played is replaced while neither player has played since,
+# and one reported with its recorded outcome is left as it is; any other
+# match is not written, so fewer rows are affected than were reported.
+REPORT_MATCHES_SQL = """
+    INSERT INTO games AS played
+        (tournament, round, player_a, player_b, outcome)
+    SELECT reported.tournament,
+           COALESCE((SELECT max(rounds.round) FROM rounds
+                     WHERE rounds.tournament = reported.tournament
+                     AND rounds.status <> 'closed'),
+                    1 + GREATEST(a.matches, COALESCE(b.matches, 0))),
+           reported.player_a, reported.player_b, reported.outcome
+    FROM %(reported)s AS reported (tournament, player_a, player_b, outcome)
+    LEFT OUTER JOIN standings AS a
+    ON a.tournament = reported.tournament AND a.id = reported.player_a
+    LEFT OUTER JOIN standings AS b
+    ON b.tournament = reported.tournament AND b.id = reported.player_b
+    ON CONFLICT (tournament, pair_low, pair_high) DO UPDATE
+    SET outcome = CASE WHEN played.player_a = EXCLUDED.player_a
+                       THEN EXCLUDED.outcome
+                       ELSE translate(EXCLUDED.outcome, 'ab', 'ba') END
+    WHERE (played.player_a, played.outcome) IN (
+              (EXCLUDED.player_a, EXCLUDED.outcome),
+              (EXCLUDED.player_b, translate(EXCLUDED.outcome, 'ab', 'ba')))
+    OR NOT EXISTS (
+        SELECT 1 FROM games AS later
+        WHERE later.tournament = played.tournament
+        AND later.entry > played.entry
+        AND (later.player_a IN (played.player_a, played.player_b)
+             OR later.player_b IN (played.player_a,
+                                   NULLIF(played.player_b, 0))))
+    """
+
+# Deletes every player, and with them every match, and the rounds they
+# played, for pgstorage.py and tournament_async.py.
+DELETE_ALL_PLAYERS_SQL = (
+    "DELETE FROM players WHERE id <> 0",
+    "DELETE FROM rounds",
+)
+
+# Selects the first of the new player ids selected by %(candidates)s, a query
+# with an id column, that is already taken in any tournament of the database
+# created by tournament.sql, for pgstorage.py and tournament_async.py.  The
+# players table can not keep ids unique across its partitions, so explicit
+# ids are checked with this after LOCK_PLAYER_IDS_SQL, which makes every
+# transaction that checks them wait for the one before to commit.
+LOCK_PLAYER_IDS_SQL = "SELECT pg_advisory_xact_lock(hashtext('player ids'))"
+TAKEN_PLAYER_ID_SQL = """
+    SELECT candidates.id FROM (%(candidates)s) AS candidates
+    WHERE candidates.id = 0
+    OR candidates.id IN (SELECT id FROM players)
+    LIMIT 1
+    """
+
+# Takes %(count)s new ids from the player id sequence in one query.
+NEW_PLAYER_IDS_SQL = """
+    SELECT nextval('players_id_seq') FROM generate_series(1, %(count)s)
+    """
+
+# Moves the player id sequence of tournament.sql past every id in use and
+# past %(atLeast)s, which is replaced with the driver's placeholder for an
+# id such as the largest explicit id about to be inserted.  The sequence
+# stays on its own START + n * INCREMENT BY ids, so shards given the same
+# step and different starts never hand out each other's ids.
+SYNC_PLAYER_IDS_SQL = """
+    SELECT setval('players_id_seq', ids.next, ids.next = ids.used)
+    FROM (
+        SELECT used,
+               start_value + GREATEST(
+                   ceil((used - start_value)::numeric / increment_by), 0
+               )::bigint * increment_by AS next
+        FROM (
+            SELECT start_value, increment_by,
+                   GREATEST((SELECT max(id) FROM players), last_value,
+                            %(atLeast)s) AS used
+            FROM pg_sequences
+            WHERE schemaname = current_schema()
+            AND sequencename = 'players_id_seq'
+        ) AS sequence
+    ) AS ids
+    """
+
+
+def explicitPlayerIDs(players):
+    """Returns the ids given with players about to be registered.
+
+    Args:   players:  A list of (id, name) tuples, with an id of None for
+                players who are to be given a new id.
+
+    Raises:   ValueError if the same id is given more than once.
+    """
+    explicitIDs = [playerID for playerID, name in players
+                   if playerID is not None]
+    if len(set(explicitIDs)) != len(explicitIDs):
+        raise ValueError("Player ids must be unique.")
+    return explicitIDs
+
+
+class Backend(object):
+    """Where tournament.py keeps its players and matches.
+
+    Every method that takes a tournament accepts 'blnk' to mean all
+    tournaments, like the functions in tournament.py.  Player 0 is the BYE
+    player; it is never counted or listed, and a bye is stored as a match
+    against it.
+    """
+
+    def transaction(self):
+        """Returns a context manager that groups work into one transaction.
+
+        Nested transactions join the outermost one.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases any connections held by the backend."""
+        pass
+
+    def counters(self):
+        """Returns how much database work this thread has done so far.
+
+        Returns:  A dictionary of the SQL statements run, the rows fetched
+                    and the seconds spent waiting for a connection.  Backends
+                    that do not use SQL always report zeros.
+        """
+        return {'statements': 0, 'rows': 0, 'wait': 0.0}
+
+    def deleteMatches(self, tournament='blnk'):
+        """Removes the match records of one or all tournaments."""
+        raise NotImplementedError
+
+    def deletePlayers(self, playerID='blnk'):
+        """Removes one or all players along with their match records."""
+        raise NotImplementedError
+
+    def countPlayers(self, tournament='blnk'):
+        """Returns the number of players registered."""
+        raise NotImplementedError
+
+    def registerPlayer(self, tournament, name):
+        """Adds a player and returns the id assigned to them."""
+        raise NotImplementedError
+
+    def registerPlayers(self, tournament, players):
+        """Adds many players and returns their ids in order.
+
+        Args:   players:  A list of (id, name) tuples.  An id of None asks the
+                    backend to assign one.
+        """
+        raise NotImplementedError
+
+    def reportMatches(self, rows):
+        """Records matches, all or none of them.
+
+        Each match is numbered with the tournament's round that is not
+        closed yet, or else with the round after the last one either of its
+        players played.  A match that was already recorded, from either
+        side, has its outcome replaced as long as neither player has played
+        since, so a submission can safely be retried.
+
+        Args:   rows:  A list of (tournament, player_a, player_b, outcome)
+                    tuples, as returned by swiss.resultRows().
+
+        Raises:   ValueError if two players have already played each other
+                    in an earlier round.
+        """
+        raise NotImplementedError
+
+    def lockRounds(self, tournament):
+        """Waits for submissions to the tournament in progress to finish.
+
+        Inside a transaction, no new submissions start until it ends.
+        """
+        raise NotImplementedError
+
+    def roundState(self, tournament):
+        """Returns the state of a tournament's latest round.
+
+        Returns:  A dictionary with the round's number (0 if no round has
+                    been paired), its status ('open', 'collecting', 'closed'
+                    or None), the number of tables it was paired with, how
+                    many of them have reported and the latest round any of
+                    the tournament's matches were played in.
+        """
+        raise NotImplementedError
+
+    def openRound(self, tournament, number, tables):
+        """Records that a round was paired with a number of tables."""
+        raise NotImplementedError
+
+    def closeRound(self, tournament, number):
+        """Marks a round as closed."""
+        raise NotImplementedError
+
+    def playerStandings(self, tournament='blnk'):
+        """Returns (id, name, wins, matches) tuples sorted by wins and OMW."""
+        raise NotImplementedError
+
+    def pairingSnapshot(self, tournament='blnk'):
+        """Returns everything swiss.pairRound() needs to pair a round.
+
+        Returns:  A tuple of (standings, history) where standings is a list
+                    of (id, name, wins, omw) tuples in standings order and
+                    history is a list of (player_id, opponent_id, result)
+                    tuples.
+        """
+        raise NotImplementedError
+
+    def rebuildStandings(self, tournament='blnk'):
+        """Recomputes the standings from the match records."""
+        raise NotImplementedError
+
+    def createTournament(self, tournament):
+        """Prepares storage for a new tournament.
+
+        Registering a player in a tournament that does not exist yet creates
+        it, so calling this first is optional.
+
+        Returns:  True if the tournament was created, False if it existed.
+        """
+        raise NotImplementedError
+
+    def purgeTournament(self, tournament, archive=False):
+        """Removes a tournament with all of its players and matches at once.
+
+        Args:   archive:  Keep the removed rows somewhere they can be read
+                    later instead of discarding them.
+        """
+        raise NotImplementedError
+
+    def iterStandings(self, tournament='blnk', fetchSize=1000):
+        """Yields (id, name, wins, matches) tuples sorted by wins and OMW.
+
+        Args:   fetchSize:  How many rows to fetch from the database at once.
+        """
+        raise NotImplementedError
+
+    def iterResults(self, tournament='blnk', fetchSize=1000):
+        """Yields every match row in the order it was recorded.
+
+        Byes are only listed from the side of the player who had them.
+
+        Returns:  (entry, tournament, player_id, player_name, opponent_id,
+                    opponent_name, result) tuples, like the v_results view.
+        """
+        raise NotImplementedError
+
+    def exportTournament(self, tournament, playersFile, matchesFile):
+        """Writes a tournament's players and matches to two CSV files.
+
+        Each file starts with a header row naming the columns in
+        PLAYER_COLUMNS and MATCH_COLUMNS.
+        """
+        raise NotImplementedError
+
+    def importTournament(self, playersFile, matchesFile):
+        """Restores the players and matches written by exportTournament().
+
+        Players keep their ids, so they must not already be registered.
+        """
+        raise NotImplementedError
+
+
+class MemoryBackend(Backend):
+    """Keeps players and matches in Python dictionaries.
+
+    This follows the same rules as the PostgreSQL database: a player can
+    only play another player once (reporting the match again replaces its
+    outcome until either player plays again), deleting a player deletes
+    their matches, and OMW is the sum of the wins of every opponent a player
+    has faced.  Nothing is written to disk.  Work is applied in full or not
+    at all, but a transaction() block is not rolled back if it raises part
+    way through.
+
+    Args:   firstID:  The id given to the first player registered.
+            idStep:  How far apart the ids handed out are, so several
+                backends can be given ids that never clash, e.g. as shards.
+    """
+
+    def __init__(self, firstID=1, idStep=1):
+        self._lock = threading.RLock()
+        self._nextID = firstID
+        self._idStep = idStep
+        self._nextEntry = 1
+        # id -> [tournament, name]
+        self._players = {}
+        # tournament -> list of player ids, in registration order
+        self._tournaments = {}
+        # entry -> (tournament, round, player_a, player_b, outcome)
+        self._games = {}
+        # id -> {opponent id: entry}
+        self._results = {}
+        # id -> [wins, losses, ties, matches]
+        self._records = {}
+        # tournament -> [[round, status, tables]], oldest first
+        self._rounds = {}
+        # (tournament, players, games) for every archived tournament
+        self.archives = []
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield self
+
+    def _playerIDs(self, tournament):
+        """Returns the ids of the players in one or all tournaments."""
+        if tournament == 'blnk':
+            return [playerID for playerIDs in self._tournaments.values()
+                    for playerID in playerIDs]
+        return list(self._tournaments.get(tournament, ()))
+
+    def _record(self, playerID, result, change):
+        """Adds or removes one result from a player's record."""
+        record = self._records.get(playerID)
+        if record is None:
+            return
+        record[('win', 'lose', 'tie').index(result)] += change
+        record[3] += change
+
+    def _result(self, playerID, entry):
+        """Returns a player's result in a match."""
+        game = self._games[entry]
+        return swiss.RESULTS[game[4]][0 if playerID == game[2] else 1]
+
+    def _playerRows(self, entry):
+        """Returns a match as one (player_id, opponent_id, result) per player."""
+        game = self._games[entry]
+        return swiss.historyRows([game[2:]])
+
+    def _isLatest(self, entry):
+        """Returns whether neither player of a match has played since."""
+        game = self._games[entry]
+        return all(later <= entry
+                   for playerID in game[2:4] if playerID != 0
+                   for later in self._results[playerID].values())
+
+    def _stored(self, entry, playerA, outcome):
+        """Returns an outcome reported from playerA's side as it is stored."""
+        if self._games[entry][2] != playerA:
+            return {'a': 'b', 'b': 'a', 't': 't'}[outcome]
+        return outcome
+
+    def _currentRound(self, tournament):
+        """Returns a tournament's latest round if it is not closed yet."""
+        rounds = self._rounds.get(tournament)
+        if rounds and rounds[-1][1] != 'closed':
+            return rounds[-1]
+        return None
+
+    def _addGames(self, games):
+        """Checks and records matches, all or none of them.
+
+        A match between two players who have already played each other
+        replaces the earlier outcome, as long as neither has played since.
+        Reporting the outcome already recorded is always allowed and changes
+        nothing, so a submission can be retried safely.
+
+        Args:   games:  A list of (tournament, round, player_a, player_b,
+                    outcome) tuples.  A round of None is filled in with the
+                    tournament's round that is not closed yet, or else the
+                    round after the last one either player played.
+        """
+        seen = set()
+        for tournament, number, playerA, playerB, outcome in games:
+            for playerID in (playerA, playerB):
+                if playerID != 0 and playerID not in self._players:
+                    raise ValueError("Player %s is not registered." % playerID)
+            pair = frozenset((playerA, playerB))
+            entry = self._results[playerA].get(playerB)
+            if (entry is not None and not self._isLatest(entry) and
+                    self._stored(entry, playerA, outcome) !=
+                    self._games[entry][4] or pair in seen):
+                raise ValueError("Player %s has already played %s."
+                                 % (playerA, playerB))
+            seen.add(pair)
+        newGames = []
+        for tournament, number, playerA, playerB, outcome in games:
+            entry = self._results[playerA].get(playerB)
+            if entry is None:
+                current = self._currentRound(tournament)
+                if not number and current:
+                    number = current[0]
+                newGames.append((tournament, number or 1 + max(
+                    self._records[playerA][3],
+                    self._records[playerB][3] if playerB else 0),
+                    playerA, playerB, outcome))
+                continue
+            for playerID, opponent, result in self._playerRows(entry):
+                self._record(playerID, result, -1)
+            game = self._games[entry]
+            self._games[entry] = game[:4] + (self._stored(entry, playerA,
+                                                          outcome),)
+            for playerID, opponent, result in self._playerRows(entry):
+                self._record(playerID, result, 1)
+        for game in newGames:
+            entry = self._nextEntry
+            self._nextEntry += 1
+            self._games[entry] = game
+            for playerID, opponent, result in self._playerRows(entry):
+                self._results[playerID][opponent] = entry
+                self._record(playerID, result, 1)
+            for paired in self._rounds.get(game[0], ()):
+                if paired[0] == game[1] and paired[1] == 'open':
+                    paired[1] = 'collecting'
+
+    def _removeGame(self, entry):
+        """Deletes a match and takes it off both players' records."""
+        for playerID, opponent, result in self._playerRows(entry):
+            del self._results[playerID][opponent]
+            self._record(playerID, result, -1)
+        del self._games[entry]
+
+    def _omw(self, playerID):
+        """Returns the sum of the wins of a player's opponents."""
+        return sum(self._records[opponent][0]
+                   for opponent in self._results[playerID]
+                   if opponent in self._records)
+
+    def deleteMatches(self, tournament='blnk'):
+        with self._lock:
+            for entry, game in list(self._games.items()):
+                if tournament == 'blnk' or game[0] == tournament:
+                    self._removeGame(entry)
+            if tournament == 'blnk':
+                self._rounds.clear()
+            else:
+                self._rounds.pop(tournament, None)
+
+    def deletePlayers(self, playerID='blnk'):
+        with self._lock:
+            if playerID == 'blnk':
+                self._players.clear()
+                self._tournaments.clear()
+                self._games.clear()
+                self._results.clear()
+                self._records.clear()
+                self._rounds.clear()
+                return
+            playerID = int(playerID)
+            if playerID not in self._players:
+                return
+            for entry in list(self._results[playerID].values()):
+                self._removeGame(entry)
+            tournament = self._players.pop(playerID)[0]
+            self._tournaments[tournament].remove(playerID)
+            del self._results[playerID]
+            del self._records[playerID]
+
+    def countPlayers(self, tournament='blnk'):
+        with self._lock:
+            if tournament == 'blnk':
+                return len(self._players)
+            return len(self._tournaments.get(tournament, ()))
+
+    def registerPlayer(self, tournament, name):
+        return self.registerPlayers(tournament, [(None, name)])[0]
+
+    def registerPlayers(self, tournament, players):
+        with self._lock:
+            explicitIDs = explicitPlayerIDs(players)
+            for playerID in explicitIDs:
+                if playerID == 0 or playerID in self._players:
+                    raise ValueError("Player id %s is already taken." % playerID)
+            if explicitIDs and self._nextID <= max(explicitIDs):
+                self._nextID += ((max(explicitIDs) - self._nextID) //
+                                 self._idStep + 1) * self._idStep
+            ids = []
+            for playerID, name in players:
+                if playerID is None:
+                    playerID = self._nextID
+                    self._nextID += self._idStep
+                self._players[playerID] = [tournament, name]
+                self._tournaments.setdefault(tournament, []).append(playerID)
+                self._results[playerID] = {}
+                self._records[playerID] = [0, 0, 0, 0]
+                ids.append(playerID)
+            return ids
+
+    def reportMatches(self, rows):
+        with self._lock:
+            self._addGames([(tournament, None, playerA, playerB, outcome)
+                            for tournament, playerA, playerB, outcome in rows])
+
+    def playerStandings(self, tournament='blnk'):
+        with self._lock:
+            standings = [(playerID, self._players[playerID][1],
+                          self._records[playerID][0], self._records[playerID][3],
+                          self._omw(playerID))
+                         for playerID in self._playerIDs(tournament)]
+        standings.sort(key=lambda row: (-row[2], -row[4]))
+        return [row[:4] for row in standings]
+
+    def pairingSnapshot(self, tournament='blnk'):
+        with self._lock:
+            playerIDs = self._playerIDs(tournament)
+            standings = [(playerID, self._players[playerID][1],
+                          self._records[playerID][0], self._omw(playerID))
+                         for playerID in playerIDs]
+            history = [(playerID, opponent, self._result(playerID, entry))
+                       for playerID in playerIDs
+                       for opponent, entry in self._results[playerID].items()
+                       if (tournament == 'blnk' or
+                           self._games[entry][0] == tournament)]
+        standings.sort(key=lambda row: (-row[2], -row[3]))
+        return standings, history
+
+    def rebuildStandings(self, tournament='blnk'):
+        with self._lock:
+            for playerID in self._playerIDs(tournament):
+                self._records[playerID] = [0, 0, 0, 0]
+                for entry in self._results[playerID].values():
+                    self._record(playerID, self._result(playerID, entry), 1)
+
+    def createTournament(self, tournament):
+        with self._lock:
+            if tournament in self._tournaments:
+                return False
+            self._tournaments[tournament] = []
+            return True
+
+    def purgeTournament(self, tournament, archive=False):
+        with self._lock:
+            playerIDs = self._playerIDs(tournament)
+            entries = self._entries(tournament)
+            if archive:
+                self.archives.append((
+                    tournament,
+                    dict((playerID, tuple(self._players[playerID]))
+                         for playerID in playerIDs),
+                    dict((entry, self._games[entry]) for entry in entries)))
+            for playerID in playerIDs:
+                self.deletePlayers(playerID)
+            self._tournaments.pop(tournament, None)
+            self._rounds.pop(tournament, None)
+
+    def lockRounds(self, tournament):
+        # Submissions hold the backend's lock for as long as they run.
+        pass
+
+    def roundState(self, tournament):
+        with self._lock:
+            rounds = self._rounds.get(tournament)
+            number, status, tables = rounds[-1] if rounds else (0, None, 0)
+            played = [game[1] for game in self._games.values()
+                      if game[0] == tournament]
+            return {
+                'round': number,
+                'status': status,
+                'tables': tables,
+                'reported': played.count(number) if number else 0,
+                'played': max(played or [0]),
+            }
+
+    def openRound(self, tournament, number, tables):
+        with self._lock:
+            rounds = self._rounds.setdefault(tournament, [])
+            if rounds and rounds[-1][0] == number:
+                rounds[-1] = [number, 'open', tables]
+            else:
+                rounds.append([number, 'open', tables])
+
+    def closeRound(self, tournament, number):
+        with self._lock:
+            for paired in self._rounds.get(tournament, ()):
+                if paired[0] == number:
+                    paired[1] = 'closed'
+
+    def iterStandings(self, tournament='blnk', fetchSize=1000):
+        for row in self.playerStandings(tournament):
+            yield row
+
+    def _entries(self, tournament):
+        """Returns the entries of one or all tournaments' matches, in order."""
+        return sorted(entry for entry, game in self._games.items()
+                      if tournament == 'blnk' or game[0] == tournament)
+
+    def iterResults(self, tournament='blnk', fetchSize=1000):
+        with self._lock:
+            names = dict((playerID, player[1])
+                         for playerID, player in self._players.items())
+            names[0] = 'BYE'
+            rows = [(entry, self._games[entry][0], playerID, names[playerID],
+                     opponent, names[opponent], result)
+                    for entry in self._entries(tournament)
+                    for playerID, opponent, result in self._playerRows(entry)]
+        for row in rows:
+            yield row
+
+    def exportTournament(self, tournament, playersFile, matchesFile):
+        with self._lock:
+            players = [(self._players[playerID][0], playerID,
+                        self._players[playerID][1])
+                       for playerID in sorted(self._playerIDs(tournament))]
+            matches = [self._games[entry]
+                       for entry in self._entries(tournament)]
+        for output, columns, rows in ((playersFile, PLAYER_COLUMNS, players),
+                                      (matchesFile, MATCH_COLUMNS, matches)):
+            writer = csv.writer(output)
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+    def importTournament(self, playersFile, matchesFile):
+        with self._lock:
+            tournaments = {}
+            for row in csv.DictReader(playersFile):
+                tournaments.setdefault(row['tournament'], []).append(
+                    (int(row['id']), row['name']))
+            for tournament, players in tournaments.items():
+                self.registerPlayers(tournament, players)
+            self._addGames([(row['tournament'], int(row['round'] or 0) or None,
+                             int(row['player_a']), int(row['player_b']),
+                             row['outcome'])
+                            for row in csv.DictReader(matchesFile)])
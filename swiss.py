@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+
+# swiss.py -- in-memory Swiss-system logic for the tournament project
+# This file holds the pure Python parts of a Swiss-system tournament so they
+# can work from a single snapshot of the database instead of one query per
+# player.
+
+import itertools
+
+
+# Fields of at least this many players have their score groups paired in
+# parallel when pairRound() is given a pool.
+PARALLEL_PLAYERS = 2000
+
+# How many players either side of an unpaired player are tried for a swap
+# before falling back to a maximum matching.
+SWAP_DISTANCE = 20
+
+
+class NoValidPairing(ValueError):
+    """Raised when every pairing of a round would include a rematch."""
+
+
+class RoundIncomplete(ValueError):
+    """Raised when a round is paired before the last one has finished."""
+
+
+def pairRound(standings, history, pool=None):
+    """Computes the pairings for the next round from a standings snapshot.
+
+    The players are expected in standings order (most wins first, then by
+    opponent match wins).  If there is an odd number of players, a bye is
+    assigned to the player closest to last place that has not had a bye
+    already.  The players are then split into score groups of equal wins;
+    when a group has an odd number of players its lowest ranked player
+    floats down to the top of the next group.  Within each group every
+    player is paired, from the top down, with the highest ranked player they
+    have not already played.
+
+    Players left over because their group had no opponent they had not
+    played are paired with each other.  Any still unpaired are swapped into
+    nearby pairs where that avoids a rematch, and if that fails too the
+    pairing is completed by a maximum matching across the whole field
+    (Edmonds' blossom algorithm).  It only aborts if no pairing without a
+    rematch exists at all.
+
+    Args:   standings:  A list of (id, name, wins, omw) tuples in standings
+                order.
+            history:  An iterable of (player_id, opponent_id, ...) tuples for
+                every match already played.  A bye is recorded with
+                opponent_id 0.  Any further columns, such as the result, are
+                ignored.
+            pool:  Optional pool of worker processes, such as a
+                multiprocessing.Pool, to pair the score groups of fields of
+                PARALLEL_PLAYERS or more in parallel.
+
+    Returns:  A tuple of (pairs, aborted) where pairs is a list of
+                (id1, name1, id2, name2) tuples with the bye, if any, first
+                and aborted is None, or the id of a player that can not be
+                paired without a rematch, in which case pairs holds only
+                the players that could be.
+    """
+    ids = [row[0] for row in standings]
+    names = [row[1] for row in standings]
+    index = dict((playerID, i) for i, playerID in enumerate(ids))
+    played = [set() for playerID in ids]
+    hadBye = set()
+    for row in history:
+        playerID, opponent = row[0], row[1]
+        i = index.get(playerID)
+        if i is None:
+            continue
+        if opponent == 0:
+            hadBye.add(i)
+        elif opponent in index:
+            played[i].add(index[opponent])
+    players = len(ids)
+    # The bye is matched like a player, as vertex number `players`.
+    mate = [None] * (players + players % 2)
+    order = list(range(players))
+    # Assign a bye week if there is an odd number of players in the round
+    if players % 2:
+        byeOrder = sorted(order,
+                          key=lambda i: (standings[i][2], standings[i][3] or 0))
+        byeCandidates = [i for i in byeOrder if i not in hadBye]
+        if not byeCandidates:
+            return [], ids[byeOrder[0]]
+        bye = byeCandidates[0]
+        mate[bye], mate[players] = players, bye
+        order.remove(bye)
+    # Pair each score group on its own, then the players left over
+    tasks = [(group, [played[i] for i in group])
+             for group in _scoreGroups(order, [row[2] for row in standings])]
+    if pool is not None and players >= PARALLEL_PLAYERS:
+        paired = pool.map(_pairGroup, tasks)
+    else:
+        paired = [_pairGroup(task) for task in tasks]
+    leftovers = []
+    for pairs, unpaired in paired:
+        for i, j in pairs:
+            mate[i], mate[j] = j, i
+        leftovers.extend(unpaired)
+    pairs, leftovers = _pairGroup((leftovers, [played[i] for i in leftovers]))
+    for i, j in pairs:
+        mate[i], mate[j] = j, i
+    if leftovers:
+        def allowed(v, w):
+            if v == players:
+                return w not in hadBye
+            if w == players:
+                return v not in hadBye
+            return w not in played[v]
+        for i in leftovers:
+            for j in leftovers:
+                if mate[i] is None and mate[j] is None and i != j:
+                    _swapIn(i, j, mate, allowed)
+        for i in leftovers:
+            if mate[i] is None:
+                _augment(i, mate, allowed)
+    pairs = []
+    aborted = None
+    if players % 2 and mate[players] is not None:
+        pairs.append((ids[mate[players]], names[mate[players]], 0, 'BYE'))
+    for i in range(players):
+        j = mate[i]
+        if j is None:
+            if aborted is None:
+                aborted = ids[i]
+        elif i < j < players:
+            pairs.append((ids[i], names[i], ids[j], names[j]))
+    return pairs, aborted
+
+
+def _scoreGroups(order, wins):
+    """Splits players in standings order into score groups to pair.
+
+    A group with an odd number of players floats its lowest ranked player
+    down to the top of the next group, so the groups can be paired
+    independently.
+    """
+    groups = []
+    floater = []
+    for score, members in itertools.groupby(order, key=lambda i: wins[i]):
+        members = floater + list(members)
+        floater = [members.pop()] if len(members) % 2 else []
+        if members:
+            groups.append(members)
+    if floater:
+        groups.append(floater)
+    return groups
+
+
+def _pairGroup(task):
+    """Pairs a score group from the top down.
+
+    Args:   task:  A tuple of (members, played) where members is a list of
+                players in standings order and played holds the set of
+                opponents each of them has already played.
+
+    Returns:  A tuple of (pairs, leftovers) where pairs is a list of
+                (player, opponent) tuples and leftovers lists the players
+                that had played every remaining member.
+    """
+    members, played = task
+    taken = [False] * len(members)
+    pairs = []
+    leftovers = []
+    for position, player in enumerate(members):
+        if taken[position]:
+            continue
+        taken[position] = True
+        other = position + 1
+        while other < len(members) and (
+                taken[other] or members[other] in played[position]):
+            other += 1
+        if other < len(members):
+            taken[other] = True
+            pairs.append((player, members[other]))
+        else:
+            leftovers.append(player)
+    return pairs, leftovers
+
+
+def _nearest(v, size):
+    """Yields every vertex but v, nearest to it in the standings first."""
+    for distance in range(1, size):
+        if v - distance >= 0:
+            yield v - distance
+        elif v + distance >= size:
+            return
+        if v + distance < size:
+            yield v + distance
+
+
+def _swapIn(v, w, mate, allowed):
+    """Pairs two unpaired players by splitting up a pair near the first.
+
+    Only the SWAP_DISTANCE players either side of v are tried, so this is
+    cheap however large the field is.
+
+    Returns:  True if a pair was found whose players could each take on one
+                of v and w.
+    """
+    for near in itertools.islice(_nearest(v, len(mate)), 2 * SWAP_DISTANCE):
+        other = mate[near]
+        if other is not None and allowed(v, near) and allowed(w, other):
+            mate[v], mate[near] = near, v
+            mate[w], mate[other] = other, w
+            return True
+    return False
+
+
+def _augment(root, mate, allowed):
+    """Grows a matching by one along an augmenting path from a free vertex.
+
+    This is the search step of Edmonds' blossom algorithm.  Once a search
+    from a vertex has failed, no later augmentation can match it either, so
+    running it once from every free vertex gives a maximum matching.
+
+    Players may meet almost anyone, so rather than listing each vertex's
+    neighbours the search takes vertices from the set of those not yet in
+    its tree and only looks at the few it is not allowed to match.  Edges
+    between two vertices already in the tree, which close blossoms, are
+    only looked for once no vertex outside the tree can be reached; by then
+    every even vertex has played every unmatched player, so there are few
+    of them.  A blossom relabels only its own members.  A search therefore
+    costs about the size of the field plus the matches already played,
+    rather than its square.
+
+    Args:   root:  The unmatched vertex to search from.
+            mate:  The matching, a list holding each vertex's partner or
+                None, which is updated in place.
+            allowed:  A function telling whether two vertices may be
+                matched.
+
+    Returns:  True if root was matched.
+    """
+    size = len(mate)
+    base = list(range(size))
+    # base -> its members, for the bases of blossoms
+    members = {}
+    parent = [None] * size
+    even = [False] * size
+    even[root] = True
+    evens = [root]
+    outside = set(range(size))
+    outside.discard(root)
+    queue = [root]
+    while True:
+        while queue:
+            v = queue.pop()
+            refused = []
+            while outside:
+                w = outside.pop()
+                if not allowed(v, w):
+                    refused.append(w)
+                    continue
+                parent[w] = v
+                if mate[w] is None:
+                    # Flip the matching along the path back to the root.
+                    while w is not None:
+                        v = parent[w]
+                        following = mate[v]
+                        mate[v], mate[w] = w, v
+                        w = following
+                    return True
+                outside.discard(mate[w])
+                even[mate[w]] = True
+                evens.append(mate[w])
+                queue.append(mate[w])
+            # A refused vertex may have joined the tree as another's mate.
+            outside.update(w for w in refused if not even[w])
+        edge = _blossomEdge(evens, base, allowed)
+        if edge is None:
+            return False
+        # An odd cycle: contract it into a blossom around its base.
+        v, w = edge
+        top = _commonBase(v, w, base, mate, parent)
+        blossom = set()
+        _markPath(v, top, w, base, mate, parent, blossom)
+        _markPath(w, top, v, base, mate, parent, blossom)
+        grown = members.pop(top, [top])
+        for old in blossom - set([top]):
+            for i in members.pop(old, [old]):
+                base[i] = top
+                grown.append(i)
+                if not even[i]:
+                    even[i] = True
+                    evens.append(i)
+                    queue.append(i)
+        members[top] = grown
+
+
+def _blossomEdge(evens, base, allowed):
+    """Returns an allowed pair of even vertices in different blossoms."""
+    for position, v in enumerate(evens):
+        for w in evens[position + 1:]:
+            if base[v] != base[w] and allowed(v, w):
+                return v, w
+    return None
+
+
+def _commonBase(v, w, base, mate, parent):
+    """Returns the base of the blossom closed by the edge from v to w."""
+    path = set()
+    while True:
+        v = base[v]
+        path.add(v)
+        if mate[v] is None:
+            break
+        v = parent[mate[v]]
+    while True:
+        w = base[w]
+        if w in path:
+            return w
+        w = parent[mate[w]]
+
+
+def _markPath(v, top, child, base, mate, parent, blossom):
+    """Adds the bases on the path from v down to the blossom's base."""
+    while base[v] != top:
+        blossom.add(base[v])
+        blossom.add(base[mate[v]])
+        parent[v] = child
+        child = mate[v]
+        v = parent[child]
+    blossom.add(top)
+
+
+# The result each player's opponent is recorded with.
+OPPOSITE_RESULT = {'win': 'lose', 'lose': 'win', 'tie': 'tie'}
+
+# The outcome code a match is stored with, for each result of player_a:
+# 'a' if player_a won, 'b' if player_b won and 't' for a tie.
+OUTCOMES = {'win': 'a', 'lose': 'b', 'tie': 't'}
+
+# The results of player_a and player_b for each outcome code.
+RESULTS = {'a': ('win', 'lose'), 'b': ('lose', 'win'), 't': ('tie', 'tie')}
+
+
+def nextRound(tournament, state):
+    """Works out which round of a tournament to pair next.
+
+    A round that is open but has no results yet is paired again, and a round
+    with every result in is closed once the next one is paired.
+
+    Args:   tournament:  A three character code assigned to each tournament.
+            state:  The tournament's round state, as returned by
+                storage.Backend.roundState().
+
+    Returns:  A tuple of (number, closing) where number is the round to pair
+                and closing is the round to close first, or None.
+
+    Raises:   RoundIncomplete if the latest round is still collecting results.
+    """
+    number = state['round']
+    if state['status'] not in ('open', 'collecting'):
+        return max(number, state['played']) + 1, None
+    if state['reported'] >= state['tables']:
+        return number + 1, number
+    if state['reported']:
+        raise RoundIncomplete(
+            'Round %s of tournament %s has %s of %s results.' % (
+                number, tournament, state['reported'], state['tables']))
+    return number, None
+
+
+def resultRows(tournament, results):
+    """Validates a round of results and turns them into match rows.
+
+    Every match is one row with the player as player_a and the opponent as
+    player_b, except that a bye (player 0) is always player_b.  Nothing is
+    returned unless every result in the round is valid.
+
+    Args:   tournament:  A three character code assigned to each tournament.
+            results:  An iterable of (playerID, opponent, result) tuples, one
+                per match.  The result must be 'win', 'lose', or 'tie' and is
+                from the perspective of the player.
+
+    Returns:  A list of (tournament, player_a, player_b, outcome) tuples, with
+                an outcome code from OUTCOMES.
+
+    Raises:   ValueError if a result is not 'win', 'lose', or 'tie', a player
+                is paired with themselves, or a player appears in more than
+                one match of the round.
+    """
+    rows = []
+    seen = set()
+    for playerID, opponent, result in results:
+        if result not in OUTCOMES:
+            raise ValueError("Result for player %s must be 'win', 'lose', or "
+                             "'tie', not %r." % (playerID, result))
+        if playerID == opponent:
+            raise ValueError("Player %s can not play themselves." % playerID)
+        for player in (playerID, opponent):
+            if player == 0:
+                continue
+            if player in seen:
+                raise ValueError("Player %s appears in more than one match "
+                                 "of the round." % player)
+            seen.add(player)
+        if playerID == 0:
+            # A bye is always stored from the side of the player who had it.
+            playerID, opponent, result = (opponent, playerID,
+                                          OPPOSITE_RESULT[result])
+        rows.append((tournament, playerID, opponent, OUTCOMES[result]))
+    return rows
+
+
+def historyRows(games):
+    """Expands match rows into one row per player, as pairRound() expects.
+
+    Args:   games:  An iterable of (player_a, player_b, outcome) tuples.
+
+    Returns:  A list of (player_id, opponent_id, result) tuples: one for each
+                player of every match, and one for the player of a bye.
+    """
+    rows = []
+    for playerA, playerB, outcome in games:
+        resultA, resultB = RESULTS[outcome]
+        rows.append((playerA, playerB, resultA))
+        if playerB != 0:
+            rows.append((playerB, playerA, resultB))
+    return rows
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# tiebreaks.py -- tie-break scores for the tournament project
+# This file computes every player's tie-break scores for a tournament at once
+# with NumPy, from the same standings and match history snapshot that
+# swiss.pairRound() uses.  Requires NumPy.
+
+import numpy
+
+# The points a player earns for each result.
+POINTS = {'win': 1.0, 'tie': 0.5, 'lose': 0.0}
+
+# The tie-breaks compute() returns, in the order they are usually applied.
+#   omw:  Sum of the wins of every opponent (what the standings table holds).
+#   omwPercentage:  Average match-win percentage of the player's opponents,
+#       each counted as at least 1/3.
+#   buchholz:  Sum of the points of every opponent.
+#   medianBuchholz:  Buchholz without the best and worst opponent, once a
+#       player has faced at least three.
+#   sonnebornBerger:  Sum of the points of the opponents a player beat, plus
+#       half the points of those they tied.
+TIEBREAKS = ('omw', 'omwPercentage', 'buchholz', 'medianBuchholz',
+             'sonnebornBerger')
+
+
+def compute(playerIDs, history):
+    """Computes every tie-break for a field of players.
+
+    Args:   playerIDs:  The ids of the players in the field.
+            history:  An iterable of (player_id, opponent_id, result) tuples
+                for every match played.  A bye is recorded with opponent_id 0
+                and does not count towards any opponent-based tie-break.
+
+    Returns:  A dictionary of NumPy arrays, each in the order of playerIDs:
+                wins, ties, matches and points, and one per name in TIEBREAKS.
+    """
+    players = len(playerIDs)
+    index = dict((playerID, i) for i, playerID in enumerate(playerIDs))
+    rows = [(index[row[0]], index.get(row[1], -1), POINTS[row[2]])
+            for row in history if row[0] in index]
+    if rows:
+        player, opponent, score = [numpy.array(column)
+                                   for column in zip(*rows)]
+    else:
+        player = numpy.zeros(0, dtype=int)
+        opponent = numpy.zeros(0, dtype=int)
+        score = numpy.zeros(0)
+
+    def total(forPlayer, weights=None):
+        return numpy.bincount(forPlayer, weights=weights,
+                              minlength=players).astype(float)
+
+    wins = total(player, (score == 1.0).astype(float))
+    ties = total(player, (score == 0.5).astype(float))
+    matches = total(player)
+    points = total(player, score)
+    # Only real opponents count towards the opponent-based tie-breaks.
+    faced = opponent >= 0
+    player, opponent, score = player[faced], opponent[faced], score[faced]
+    opponents = total(player)
+    played = numpy.maximum(matches, 1)
+    winPercentage = numpy.maximum((3 * wins + ties) / (3 * played), 1.0 / 3)
+    buchholz = total(player, points[opponent])
+    best = numpy.full(players, -numpy.inf)
+    worst = numpy.full(players, numpy.inf)
+    numpy.maximum.at(best, player, points[opponent])
+    numpy.minimum.at(worst, player, points[opponent])
+    best[opponents == 0] = 0
+    worst[opponents == 0] = 0
+    return {
+        'wins': wins,
+        'ties': ties,
+        'matches': matches,
+        'points': points,
+        'omw': total(player, wins[opponent]),
+        'omwPercentage': numpy.where(
+            opponents > 0,
+            total(player, winPercentage[opponent]) / numpy.maximum(opponents, 1),
+            0.0),
+        'buchholz': buchholz,
+        'medianBuchholz': numpy.where(opponents >= 3,
+                                      buchholz - best - worst, buchholz),
+        'sonnebornBerger': total(player, score * points[opponent]),
+    }
+
+
+def order(scores, tiebreaks):
+    """Returns the positions of the players in standings order.
+
+    Players are sorted by wins and then by each tie-break in turn, highest
+    first.  Players who are tied on everything keep the order they were
+    passed in.
+
+    Args:   scores:  A dictionary returned by compute().
+            tiebreaks:  A sequence of names from TIEBREAKS.
+    """
+    keys = [-scores[name] for name in reversed(tiebreaks)] + [-scores['wins']]
+    return numpy.lexsort(keys)
@@ -4,7 +4,170 @@
 # This file defines multiple Python functions to be used in facilitating
 # a Swiss-system tournament
 
-import psycopg2
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+import cache
+import instrument
+import sharding
+import storage
+import swiss
+from instrument import addHook, metricsSnapshot, removeHook, resetMetrics
+from swiss import NoValidPairing, RoundIncomplete
+
+try:
+    import pgstorage
+except ImportError:
+    # psycopg2 is not installed, so only the in-memory backend is available.
+    pgstorage = None
+
+try:
+    import tiebreaks
+except ImportError:
+    # NumPy is not installed, so ties can only be broken by OMW.
+    tiebreaks = None
+
+
+# The database to connect to.  This can be set with the TOURNAMENT_DSN
+# environment variable or by calling configure().
+DSN = os.environ.get('TOURNAMENT_DSN', 'dbname=tournament')
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 10
+
+# Set TOURNAMENT_SHARDS to the path of a JSON file to spread tournaments
+# across several databases, see configureShards().
+SHARDS_FILE = os.environ.get('TOURNAMENT_SHARDS')
+
+# Set TOURNAMENT_BACKEND=memory to keep everything in memory instead of in
+# PostgreSQL, e.g. to run tournament_test.py without a database.
+BACKEND = os.environ.get('TOURNAMENT_BACKEND', 'postgres')
+
+# The tie-breaks that order players with the same number of wins, see
+# setTiebreaks().
+TIEBREAKS = ('omw',)
+
+# The most standings rows kept in memory across all tournaments, see
+# configureCache().
+CACHE_ROWS = 100000
+
+# How many rows iterStandings() and iterResults() fetch from the database at
+# a time.
+FETCH_SIZE = 1000
+
+# How many worker processes pair the score groups of large fields, see
+# configurePairing().
+PAIRING_WORKERS = 0
+
+_backend = None
+_pairingPool = None
+_cache = cache.StandingsCache(CACHE_ROWS)
+# Tracks the transaction depth of each thread and the tournaments changed
+# inside the outermost transaction.
+_local = threading.local()
+
+log = instrument.log
+
+
+def useBackend(backend):
+    """Sets where every function stores players and matches.
+
+    Args:   backend:  A storage.Backend, e.g. storage.MemoryBackend() or
+                pgstorage.PostgresBackend('dbname=tournament').
+    """
+    global _backend
+    if _backend is not None and _backend is not backend:
+        _backend.close()
+    _backend = backend
+    _cache.clear()
+
+
+def getBackend():
+    """Returns the storage backend, creating the default one on first use."""
+    if _backend is None:
+        if BACKEND == 'memory':
+            useBackend(storage.MemoryBackend())
+        elif SHARDS_FILE:
+            with open(SHARDS_FILE) as config:
+                settings = json.load(config)
+            configureShards(settings['shards'], settings.get('assignments'))
+        else:
+            configure()
+    return _backend
+
+
+def configure(dsn=None, minconn=MIN_CONNECTIONS, maxconn=MAX_CONNECTIONS):
+    """Stores everything in PostgreSQL with the connection settings passed.
+
+    Any existing connection pool is closed and a new one is opened on the
+    next call that needs the database.
+
+    Args:   dsn:  Optional libpq connection string, e.g. 'dbname=tournament'.
+                If no argument is passed the current DSN is kept.
+            minconn:  Number of connections the pool keeps open.
+            maxconn:  Most connections the pool will open at once.  Callers
+                wait for a free connection once this many are in use.
+    """
+    global DSN, MIN_CONNECTIONS, MAX_CONNECTIONS
+    if dsn is not None:
+        DSN = dsn
+    MIN_CONNECTIONS = minconn
+    MAX_CONNECTIONS = maxconn
+    useBackend(pgstorage.PostgresBackend(DSN, MIN_CONNECTIONS, MAX_CONNECTIONS))
+
+
+def configureReplicas(replicas, readYourWrites=True, maxWait=1.0):
+    """Reads standings and pairing snapshots from replicas of the database.
+
+    Writes, and reads inside a transaction that has written, stay on the
+    database set with configure().  Reads of standings, player counts and
+    the snapshots swissPairings() pairs from are spread over the replicas,
+    see pgstorage.ReplicatedBackend.
+
+    Args:   replicas:  A list of libpq connection strings of streaming
+                replicas of the database.
+            readYourWrites:  Whether a read waits for the replica to replay
+                every earlier write of this process.  Without it the
+                standings cache can keep a read from a lagging replica, so
+                call configureCache(0) as well.
+            maxWait:  The most seconds a read waits for a replica before
+                reading from the primary instead.
+    """
+    useBackend(pgstorage.ReplicatedBackend(
+        pgstorage.PostgresBackend(DSN, MIN_CONNECTIONS, MAX_CONNECTIONS),
+        [pgstorage.PostgresBackend(dsn, MIN_CONNECTIONS, MAX_CONNECTIONS)
+         for dsn in replicas],
+        readYourWrites, maxWait))
+
+
+def configureShards(shards, assignments=None, minconn=MIN_CONNECTIONS,
+                    maxconn=MAX_CONNECTIONS):
+    """Spreads the tournaments across several PostgreSQL databases.
+
+    Each tournament is kept in one database, picked by consistent hashing of
+    its code unless it is assigned to one.  The functions for every
+    tournament ('blnk') combine the work of all of them.  Each database must
+    be created with tournament.sql and hand out player ids no other shard
+    uses, see sharding.ShardedBackend.
+
+    The same settings can be read from the JSON file named by the
+    TOURNAMENT_SHARDS environment variable, e.g.
+    {"shards": {"east": "dbname=east", "west": "host=west dbname=t"},
+     "assignments": {"ABC": "east"}}
+
+    Args:   shards:  A dictionary of shard name to libpq connection string.
+            assignments:  Optional dictionary of tournament code to shard
+                name for tournaments placed by hand.
+            minconn:  Number of connections each shard's pool keeps open.
+            maxconn:  Most connections each shard's pool will open at once.
+    """
+    useBackend(sharding.ShardedBackend(
+        dict((name, pgstorage.PostgresBackend(dsn, minconn, maxconn))
+             for name, dsn in shards.items()),
+        assignments))
 
 
 def connect():
@@ -12,9 +175,200 @@ def connect():
 
     Returns: a database connection.
     """
-    return psycopg2.connect("dbname=tournament")
+    return pgstorage.connect(DSN)
+
+
+def configureCache(maxRows=CACHE_ROWS):
+    """Sets how many standings rows are kept in memory between reads.
+
+    playerStandings() and swissPairings() keep what they read from the
+    backend for each tournament until a function in this file changes that
+    tournament's players or matches, so repeated reads between results are
+    served from memory.  Reads of every tournament are kept until any
+    tournament changes.  The least recently read tournaments are dropped
+    first once maxRows rows are held.
+
+    The cache only sees changes made through this process.  If other
+    processes write to the same database, set maxRows to 0 to turn it off,
+    or call clearCache() when they do.
+
+    Args:   maxRows:  The most rows to keep across all tournaments.  0 turns
+                the cache off.
+    """
+    global CACHE_ROWS
+    CACHE_ROWS = maxRows
+    _cache.maxRows = maxRows
+    _cache.clear()
+
+
+def configurePairing(workers=PAIRING_WORKERS):
+    """Sets how many worker processes swissPairings() uses.
+
+    Fields of swiss.PARALLEL_PLAYERS players or more have their score groups
+    paired in parallel across a pool of processes.  Smaller fields are always
+    paired in this process.
+
+    Args:   workers:  The number of worker processes.  0 pairs every field in
+                this process.
+    """
+    global PAIRING_WORKERS, _pairingPool
+    if _pairingPool is not None:
+        _pairingPool.close()
+        _pairingPool.join()
+        _pairingPool = None
+    PAIRING_WORKERS = workers
+    if workers:
+        _pairingPool = Pool(workers)
+
+
+def clearCache():
+    """Drops every cached standings read."""
+    _cache.clear()
+
+
+def cacheStats():
+    """Returns how many cached reads were used and how many were missed.
+
+    Returns:  A dictionary with the number of hits and misses so far.
+    """
+    return {'hits': _cache.hits, 'misses': _cache.misses}
+
+
+def _changed(tournament='blnk'):
+    """Marks a tournament, or with 'blnk' every tournament, as changed.
+
+    Inside a transaction the cache is only told once the outermost block
+    exits, so that nothing read before the commit is cached as current.
+    """
+    if getattr(_local, 'depth', 0):
+        _local.changed.add(tournament)
+    else:
+        _cache.bump(tournament)
+
+
+def _cachedRead(tournament, kind, read):
+    """Returns read(), or a copy of what it returned last time.
+
+    Reads inside a transaction that has changed anything are never cached,
+    since they may see changes that are not committed yet.
+
+    Args:   tournament:  The tournament being read.
+            kind:  A name for what is read, e.g. 'standings'.
+            read:  A function that reads from the backend and returns a list
+                of rows, or a tuple of such lists.
+    """
+    if not CACHE_ROWS or (getattr(_local, 'depth', 0) and _local.changed):
+        return read()
+    version = _cache.version(tournament)
+    value = _cache.get(tournament, kind, version)
+    if value is None:
+        value = read()
+        if isinstance(value, tuple):
+            rows = sum(len(part) for part in value)
+        else:
+            rows = len(value)
+        _cache.put(tournament, kind, version, value, rows)
+    if isinstance(value, tuple):
+        return tuple(list(part) for part in value)
+    return list(value)
+
+
+def _standingsRead(tournament):
+    """Returns the backend's standings of a tournament."""
+    return _cachedRead(tournament, 'standings',
+                       lambda: getBackend().playerStandings(tournament))
+
+
+def _pairingRead(tournament):
+    """Returns the backend's pairing snapshot of a tournament."""
+    return _cachedRead(tournament, 'pairing',
+                       lambda: getBackend().pairingSnapshot(tournament))
+
+
+def setTiebreaks(*names):
+    """Sets the tie-breaks that order players with the same number of wins.
+
+    By default players are ordered by OMW, which the standings table keeps up
+    to date.  Any other tie-break from tiebreaks.TIEBREAKS needs NumPy, and is
+    computed for the whole tournament at once from its match history each
+    time the standings or pairings are read.
+
+    Example:  setTiebreaks('omwPercentage', 'buchholz', 'sonnebornBerger')
+
+    Args:   names:  Tie-break names, most important first.
+
+    Raises:   ValueError if a tie-break is unknown or NumPy is not installed.
+    """
+    global TIEBREAKS
+    if names != ('omw',):
+        if tiebreaks is None:
+            raise ValueError("NumPy is required for tie-breaks other than "
+                             "'omw'.")
+        unknown = [name for name in names if name not in tiebreaks.TIEBREAKS]
+        if unknown or not names:
+            raise ValueError("Tie-breaks must be chosen from %s." %
+                             ', '.join(tiebreaks.TIEBREAKS))
+    TIEBREAKS = tuple(names)
+
+
+def _tiebreakSnapshot(tournament):
+    """Reads a tournament and orders it by the configured tie-breaks.
+
+    Returns:  A tuple of (standings, history, scores) where standings is a
+                list of (id, name, wins, first tie-break) tuples in standings
+                order and scores is a dictionary from tiebreaks.compute(),
+                in the same order.
+    """
+    standings, history = _pairingRead(tournament)
+    scores = tiebreaks.compute([row[0] for row in standings], history)
+    order = tiebreaks.order(scores, TIEBREAKS)
+    scores = dict((name, values[order]) for name, values in scores.items())
+    standings = [standings[i][:3] + (scores[TIEBREAKS[0]][position],)
+                 for position, i in enumerate(order)]
+    return standings, history, scores
+
+
+# Records call metrics against the current backend's counters.
+_instrumented = instrument.instrumented(lambda: getBackend().counters())
+
 
+def transaction():
+    """Runs a block of work in one transaction.
 
+    Every function in this file uses transaction(), so calling several of
+    them inside a `with transaction():` block groups their work into a single
+    transaction.  The transaction is committed when the outermost block
+    exits and rolled back if it raises an error.
+
+    Example:  with transaction():
+                  reportMatch('ABC', 1, 2, 'win')
+                  reportMatch('ABC', 3, 4, 'tie')
+
+    Returns:  A context manager.  With PostgreSQL it gives a cursor on the
+                transaction's connection.
+    """
+    return _transaction()
+
+
+@contextmanager
+def _transaction():
+    """Wraps the backend's transaction and tells the cache what changed."""
+    depth = getattr(_local, 'depth', 0)
+    if not depth:
+        _local.changed = set()
+    _local.depth = depth + 1
+    try:
+        with getBackend().transaction() as handle:
+            yield handle
+    finally:
+        _local.depth = depth
+        if not depth:
+            changed, _local.changed = _local.changed, set()
+            for tournament in changed:
+                _cache.bump(tournament)
+
+
+@_instrumented
 def deleteMatches(tournament='blnk'):
     """Remove all the match records from an individual or all tournaments
 
@@ -27,20 +381,15 @@ def deleteMatches(tournament='blnk'):
             blnk:  If there is no argument passed, all matches in all
                 tournaments will be deleted.
     """
-    db = connect()
-    db_cursor = db.cursor()
+    getBackend().deleteMatches(tournament)
+    _changed(tournament)
     if tournament == 'blnk':
-        query = "DELETE FROM matches"
-        db_cursor.execute(query)
-        print '==>  All matches were deleted successfully.'
+        log.info('All matches were deleted.')
     else:
-        query = "DELETE FROM matches WHERE tournament = %s"
-        db_cursor.execute(query, (tournament,))
-        print '==>  All matches were deleted from ' + tournament + ' successfully.'
-    db.commit()
-    db.close()
+        log.info('All matches were deleted from tournament %s.', tournament)
 
 
+@_instrumented
 def deletePlayers(playerID='blnk'):
     """Removes player(s) from the database.
 
@@ -56,20 +405,57 @@ def deletePlayers(playerID='blnk'):
                 player.
             blnk:  If there is no argument passed, all players will be deleted.
     """
-    db = connect()
-    db_cursor = db.cursor()
+    getBackend().deletePlayers(playerID)
+    _changed()
     if playerID == 'blnk':
-        query = "DELETE FROM players where id <> 0"
-        db_cursor.execute(query)
-        print '==>  All players were deleted successfully.'
+        log.info('All players were deleted.')
     else:
-        query = "DELETE FROM players WHERE id = %s"
-        db_cursor.execute(query, (playerID))
-        print '==>  Player ID: ' + playerID + ' deleted.'
-    db.commit()
-    db.close()
+        log.info('Player ID %s was deleted.', playerID)
+
+
+@_instrumented
+def createTournament(tournament):
+    """Prepares the database for a new tournament.
+
+    With PostgreSQL every tournament has its own partition of the players,
+    matches and standings tables, which this creates along with the
+    tournament's BYE player.  Registering a player in a new tournament calls
+    it automatically, so calling it first is optional.
+
+    Args:   tournament:  A three character code assigned to each tournament.
+
+    Returns:  True if the tournament was created, False if it already existed.
+    """
+    created = getBackend().createTournament(tournament)
+    if created:
+        log.info('Tournament %s was created.', tournament)
+    return created
 
 
+@_instrumented
+def purgeTournament(tournament, archive=False):
+    """Removes a tournament along with all of its players and matches.
+
+    With PostgreSQL the tournament's partitions are detached from the players,
+    matches and standings tables in one quick catalog change, instead of
+    deleting their rows one by one, so other tournaments are only blocked
+    for a moment.  The detached tables are then dropped, or kept for
+    archiving as stand-alone tables named after the partition and the time,
+    e.g. players_ABC_20160314150926.
+
+    Args:   tournament:  A three character code assigned to each tournament.
+            archive:  Optional argument.  If True the tournament's tables are
+                kept instead of dropped.
+    """
+    getBackend().purgeTournament(tournament, archive)
+    _changed(tournament)
+    if archive:
+        log.info('Tournament %s was archived.', tournament)
+    else:
+        log.info('Tournament %s was purged.', tournament)
+
+
+@_instrumented
 def countPlayers(tournament='blnk'):
     """Returns the number of players registered.
 
@@ -82,23 +468,16 @@ def countPlayers(tournament='blnk'):
             blnk:  If there is no argument passed, all players in all
                 tournaments will be counted.
     """
-    db = connect()
-    db_cursor = db.cursor()
+    count = getBackend().countPlayers(tournament)
     if tournament == 'blnk':
-        query = "SELECT count(*) FROM players WHERE id <> 0"
-        db_cursor.execute(query)
-        rows = db_cursor.fetchone()
-        print '==>  ' + str(rows[0]) + ' players are registered for all tournaments.'
+        log.info('%s players are registered for all tournaments.', count)
     else:
-        query = "SELECT count(*) FROM players WHERE tournament = %s AND id <> 0"
-        db_cursor.execute(query, (tournament,))
-        rows = db_cursor.fetchone()
-        print '==>  ' + str(rows[0]) + ' players are registered for tournament ' + tournament + '.'
-    db.commit()
-    db.close()
-    return rows[0]
+        log.info('%s players are registered for tournament %s.', count,
+                 tournament)
+    return count
 
 
+@_instrumented
 def registerPlayer(tournament, name):
     """Adds a player to the tournament database.
 
@@ -110,30 +489,57 @@ def registerPlayer(tournament, name):
                 compete in the tournament passed.
             name:  The player's full name.  This does not need to be a uniue
                 value
+
+    Returns:  The id number assigned to the player.
     """
-    db = connect()
-    db_cursor = db.cursor()
-    query = "INSERT INTO players (tournament, name) VALUES (%s, %s)"
-    # Try to register player 100 times. Incase serial generated id == previously entered user id
-    for i in range(1, 100):
-        try:
-            db_cursor.execute(query, (tournament, name,))
-            break
-        except psycopg2.IntegrityError:
-            # If error from duplicate id is thrown, roll back changes.
-            db.rollback()
-    else:
-        print 'We tried 100 times to enter register the player and a unique id could not be assigned.  Run registerPlayer(tournament) again to try 100 more times.'
-    print '==>  ' + name + ' has been registered for tournament: ' + tournament
-    db.commit()
-    db.close()
+    playerID = getBackend().registerPlayer(tournament, name)
+    _changed(tournament)
+    log.info('%s has been registered for tournament %s.', name, tournament)
+    return playerID
+
+
+@_instrumented
+def registerPlayers(tournament, players):
+    """Adds many players to a tournament in one transaction.
+
+    With PostgreSQL the players are streamed into the players table with
+    COPY.  Players can be registered with an id of their own, e.g. when
+    importing entrants from another system; the id sequence is moved past
+    any such ids so later registrations never collide with them.
+
+    Args:   tournament:  A three character code assigned to each tournament.
+                Players will be registered to compete in the tournament
+                passed.
+            players:  A list of player names, or of (id, name) tuples for
+                players that should keep an existing id.  Both may be mixed.
+
+    Returns:  A list of the players' ids, in the order they were passed.
+    """
+    players = [(None, player) if isinstance(player, basestring) else tuple(player)
+               for player in players]
+    if not players:
+        return []
+    ids = getBackend().registerPlayers(tournament, players)
+    _changed(tournament)
+    log.info('%s players have been registered for tournament %s.', len(ids),
+             tournament)
+    return ids
 
 
-def playerStandings():
-    """Returns a list of all players and their win records, sorted by wins.
+@_instrumented
+def playerStandings(tournament='blnk'):
+    """Returns a list of players and their win records, sorted by wins.
 
     The first entry will be the player in first place, or a player tied for
-    first place.
+    first place.  Players with the same number of wins are ordered by OMW, or
+    by the tie-breaks chosen with setTiebreaks().  When a tournament code is
+    passed as the argument, only the players registered to that tournament
+    will be returned.
+
+    Args:   tournament:  Optional argument that takes a three character code
+                assigned to each tournament.
+            blnk:  If there is no argument passed, the players of all
+                tournaments will be returned.
 
     Returns:  A list of tuples, each of which contains:
                 id:  The player's unique id (assigned by the database).
@@ -141,16 +547,151 @@ def playerStandings():
                 wins:  The number of matches the player has won.
                 matches:  The number of matches the player has played.
     """
-    db = connect()
-    db_cursor = db.cursor()
-    query = "SELECT * FROM playerStandings"
-    db_cursor.execute(query)
-    standings = db_cursor.fetchall()
-    db.close()
-    print '==>  Player standings compiled successfully.'
+    if TIEBREAKS == ('omw',):
+        standings = _standingsRead(tournament)
+    else:
+        rows, history, scores = _tiebreakSnapshot(tournament)
+        standings = [(row[0], row[1], row[2], int(matches))
+                     for row, matches in zip(rows, scores['matches'])]
+    log.info('Player standings compiled.')
+    return standings
+
+
+@_instrumented
+def tiebreakStandings(tournament='blnk'):
+    """Returns the standings along with each player's tie-break scores.
+
+    Requires NumPy.  Players are ordered by wins and then by the tie-breaks
+    set with setTiebreaks().
+
+    Args:   tournament:  Optional argument that takes a three character code
+                assigned to each tournament.
+            blnk:  If there is no argument passed, the players of all
+                tournaments will be returned.
+
+    Returns:  A list of tuples, each of which contains the player's id, name,
+                wins and matches followed by one score for each tie-break in
+                TIEBREAKS.
+    """
+    if tiebreaks is None:
+        raise ValueError("NumPy is required for tiebreakStandings().")
+    rows, history, scores = _tiebreakSnapshot(tournament)
+    standings = [row[:3] + (int(scores['matches'][position]),) +
+                 tuple(float(scores[name][position]) for name in TIEBREAKS)
+                 for position, row in enumerate(rows)]
+    log.info('Tie-break standings compiled.')
     return standings
 
 
+def iterStandings(tournament='blnk', fetchSize=None):
+    """Yields the standings one player at a time.
+
+    With PostgreSQL the rows are read through a server-side cursor, so only
+    fetchSize of them are held in memory at once however large the
+    tournament is.  Players with the same number of wins are always ordered
+    by OMW, since the other tie-breaks need the whole tournament at once.
+    The read runs on a connection of its own until the generator is
+    exhausted or closed, so the caller can report results while iterating.
+
+    Args:   tournament:  Optional argument that takes a three character code
+                assigned to each tournament.
+            blnk:  If there is no argument passed, the players of all
+                tournaments will be returned.
+            fetchSize:  Optional number of rows to fetch at a time.  Defaults
+                to FETCH_SIZE.
+
+    Returns:  A generator of (id, name, wins, matches) tuples, as returned by
+                playerStandings().
+    """
+    return getBackend().iterStandings(tournament, fetchSize or FETCH_SIZE)
+
+
+def iterResults(tournament='blnk', fetchSize=None):
+    """Yields every match recorded, oldest first, one row at a time.
+
+    Like iterStandings(), the rows are read through a server-side cursor
+    fetchSize at a time.  Each match is listed once for each player, and a
+    bye once for the player who had it.
+
+    Args:   tournament:  Optional argument that takes a three character code
+                assigned to each tournament.
+            blnk:  If there is no argument passed, the matches of all
+                tournaments will be returned.
+            fetchSize:  Optional number of rows to fetch at a time.  Defaults
+                to FETCH_SIZE.
+
+    Returns:  A generator of tuples with the same columns as the v_results
+                view: entry, tournament, player_id, player_name, opponent_id,
+                opponent_name and result.
+    """
+    return getBackend().iterResults(tournament, fetchSize or FETCH_SIZE)
+
+
+@_instrumented
+def exportTournament(tournament, playersFile, matchesFile):
+    """Archives a tournament's players and matches as two CSV files.
+
+    With PostgreSQL the rows are streamed straight from the database with
+    COPY, so exporting a tournament of any size runs in constant memory.
+
+    Example:  with open('ABC-players.csv', 'wb') as players:
+                  with open('ABC-matches.csv', 'wb') as matches:
+                      exportTournament('ABC', players, matches)
+
+    Args:   tournament:  A three character code assigned to each tournament,
+                or 'blnk' to export every tournament.
+            playersFile:  A file opened for writing.  It receives a header
+                row and then one (tournament, id, name) row per player.
+            matchesFile:  A file opened for writing.  It receives a header
+                row and then one (tournament, player_id, opponent_id,
+                result) row per match record.
+    """
+    getBackend().exportTournament(tournament, playersFile, matchesFile)
+    if tournament == 'blnk':
+        log.info('All tournaments were exported.')
+    else:
+        log.info('Tournament %s was exported.', tournament)
+
+
+@_instrumented
+def importTournament(playersFile, matchesFile):
+    """Restores players and matches archived with exportTournament().
+
+    Players keep the ids they were exported with, so they must not still be
+    registered, e.g. import after deleting the tournament's players or into
+    an empty database.  With PostgreSQL the rows are streamed in with COPY
+    in one transaction.
+
+    Args:   playersFile:  The players CSV file, opened for reading.
+            matchesFile:  The matches CSV file, opened for reading.
+    """
+    getBackend().importTournament(playersFile, matchesFile)
+    _changed()
+    log.info('Players and matches were imported.')
+
+
+@_instrumented
+def rebuildStandings(tournament='blnk'):
+    """Recomputes the standings table from the match records.
+
+    The standings are kept up to date automatically as matches are reported
+    and deleted, so this is only needed after changing the players or matches
+    tables by hand.
+
+    Args:   tournament:  Optional argument that takes a three character code
+                assigned to each tournament.
+            blnk:  If there is no argument passed, the standings of all
+                tournaments will be rebuilt.
+    """
+    getBackend().rebuildStandings(tournament)
+    _changed(tournament)
+    if tournament == 'blnk':
+        log.info('Standings were rebuilt for all tournaments.')
+    else:
+        log.info('Standings were rebuilt for tournament %s.', tournament)
+
+
+@_instrumented
 def reportMatch(tournament, playerID, opponent, result):
     """Records the outcome of a single match between two players.
 
@@ -163,140 +704,171 @@ def reportMatch(tournament, playerID, opponent, result):
             opponent:  The id number of the player's opponent.
             result:  The result of the match. Must be 'win', 'lose', or 'tie'.
                 This is reported from the perspective of the player.
+
+    Reporting the same match again is safe: the outcome is replaced, as long
+    as neither player has played since.
+
+    Raises:   ValueError if the players have already played each other in an
+                earlier round.
+    """
+    getBackend().reportMatches(
+        swiss.resultRows(tournament, [(playerID, opponent, result)]))
+    _changed(tournament)
+    log.info('Match recorded in tournament %s: player %s, opponent %s, '
+             'result %s.', tournament, playerID, opponent, result)
+
+
+@_instrumented
+def reportRound(tournament, results):
+    """Records the outcome of every match in a round in one transaction.
+
+    The results are checked before anything is written.  Each match is then
+    recorded for both the player and the opponent with a single multi-row
+    insert, so either the whole round is recorded or none of it is.  A
+    round can be reported again, e.g. after a timeout, without recording
+    any match twice; outcomes that changed are replaced.
+
+    Args:   tournament:  A three character code assigned to each tournament.
+                This would be the tournament that the players are enrolled in.
+            results:  A list of (playerID, opponent, result) tuples, one per
+                match.  A bye is reported with an opponent of 0.  The result
+                must be 'win', 'lose', or 'tie' and is reported from the
+                perspective of the player.
+
+    Raises:   ValueError if any result in the round is invalid, or if two of
+                the players already played each other in an earlier round.
+    """
+    rows = swiss.resultRows(tournament, results)
+    if not rows:
+        return
+    getBackend().reportMatches(rows)
+    _changed(tournament)
+    log.info('%s matches recorded for tournament %s.', len(results), tournament)
+
+
+@_instrumented
+def roundStatus(tournament):
+    """Returns the state of a tournament's latest round.
+
+    A round is 'open' once swissPairings() has paired it, 'collecting' once
+    its first result is reported and 'closed' once the next round is paired
+    or closeRound() is called.
+
+    Args:   tournament:  A three character code assigned to each tournament.
+
+    Returns:  A dictionary with:
+                round:  The number of the latest round paired, or 0.
+                status:  'open', 'collecting', 'closed', or None if no round
+                    has been paired.
+                tables:  The number of matches, including any bye, that the
+                    round was paired with.
+                reported:  How many of them have been reported.
+    """
+    state = getBackend().roundState(tournament)
+    del state['played']
+    return state
+
+
+@_instrumented
+def closeRound(tournament):
+    """Closes a tournament's latest round even if results are missing.
+
+    This lets the next round be paired when a match will not be played,
+    e.g. after a player drops out.
+
+    Args:   tournament:  A three character code assigned to each tournament.
     """
-    db = connect()
-    db_cursor = db.cursor()
-    query = "INSERT INTO matches (tournament, player_id, opponent_id, result) VALUES (%s, %s, %s, %s)"
-    db_cursor.execute(query, (tournament, playerID, opponent, result))
-    print '==>  Match recorded successfully. \n ====>  Player ID: %s \n ====>  Opponent ID: %s \n ====>  Tournament: %s \n ====>  Result: %s' % (str(playerID), str(opponent), tournament, result)
-    if opponent <> 0:
-        if result == 'win':
-            db_cursor.execute(query, (tournament, opponent, playerID, 'lose'))
-            print '==>  Match recorded successfully. \n ====>  Player ID: %s \n ====>  Opponent ID: %s \n ====>  Tournament: %s \n ====>  Result: lose' % (str(opponent), str(playerID), tournament)
-        elif result == 'lose':
-            print '==>  Match recorded successfully. \n ====>  Player ID: %s \n ====>  Opponent ID: %s \n ====>  Tournament: %s \n ====>  Result: win' % (str(opponent), str(playerID), tournament)
-            db_cursor.execute(query, (tournament, opponent, playerID, 'win'))
+    with transaction():
+        backend = getBackend()
+        backend.lockRounds(tournament)
+        number = backend.roundState(tournament)['round']
+        if number:
+            backend.closeRound(tournament, number)
+    log.info('Round %s of tournament %s was closed.', number, tournament)
+
+
+def _pairNextRound(tournament):
+    """Pairs a tournament's next round and records it as open.
+
+    Submissions in progress are waited for first.  A round that is open but
+    has no results yet is paired again.
+
+    Raises:   RoundIncomplete if the latest round is still collecting results.
+              NoValidPairing if every pairing would include a rematch.
+    """
+    backend = getBackend()
+    with transaction():
+        closing = None
+        if tournament != 'blnk':
+            backend.lockRounds(tournament)
+            number, closing = swiss.nextRound(tournament,
+                                              backend.roundState(tournament))
+        if TIEBREAKS == ('omw',):
+            standings, history = _pairingRead(tournament)
         else:
-            db_cursor.execute(query, (tournament, opponent, playerID, 'tie'))
-            print '==>  Match recorded successfully. \n ====>  Player ID: %s \n ====>  Opponent ID: %s \n ====>  Tournament: %s \n ====>  Result: tie' % (str(opponent), str(playerID), tournament)
-    db.commit()
-    db.close()
+            standings, history, scores = _tiebreakSnapshot(tournament)
+        swissPairs, aborted = swiss.pairRound(standings, history,
+                                              _pairingPool)
+        if aborted is not None:
+            raise NoValidPairing(
+                'Player %s of tournament %s can not be paired without a '
+                'rematch.' % (aborted, tournament))
+        # Rounds are only written once the snapshot is read, so it can come
+        # from a replica.
+        if closing is not None:
+            backend.closeRound(tournament, closing)
+        if tournament != 'blnk':
+            backend.openRound(tournament, number, len(swissPairs))
+    return swissPairs
 
 
 # Make the tournament argument optional to that all players will be included
 # if it is left blank.
-def swissPairings(tournament='blnk'):
+@_instrumented
+def swissPairings(tournament='blnk', wait=0):
     """Returns a list of pairs of players for the next round of a match.
 
-    This sorts the current players by wins and then by opponent match wins.
-    If there is an odd number of players, a bye week is assigned to the
-    player closest to last place that has not had a bye round already.  (Each
-    player can only have one bye round.)  The first place player is then paired
-    with the highest ranked player that he has not already playerd. (Each
-    player can only play another player one time.)  If the pairings can not be
-    completed due to a player having played all other players, the pairing will
-    be aborted.
+    This sorts the current players by wins and then by opponent match wins
+    (or the tie-breaks chosen with setTiebreaks()).  If there is an odd
+    number of players, a bye week is assigned to the player closest to last
+    place that has not had a bye round already.  (Each player can only have
+    one bye round.)  The first place player is then paired with the highest
+    ranked player that he has not already playerd. (Each player can only
+    play another player one time.)  Players are paired within their score
+    group first; if that leaves players who have played everyone left in
+    their group, the pairings are completed across groups, see
+    swiss.pairRound().
+
+    The pairs are recorded as the tournament's next round, see roundStatus().
+    Results still being submitted are waited for, but the next round is only
+    paired once every match of the current one has been reported.  Calling
+    swissPairings() again before any results are in pairs the same round
+    again.
 
     Args:     tournament:  A three character code assigned to each tournament.
                   Only the players that are registered for the tournament code
                   passed in will be included in the pairings.
+              wait:  Optional number of seconds to wait for the current round
+                  to finish before giving up.
 
     Returns:  A list of tuples, each of which contains (id1, name1, id2, name2)
                   id1: the first player's unique id
                   name1: the first player's name
                   id2: the second player's unique id
                   name2: the second player's name
+
+    Raises:   RoundIncomplete if the current round is still missing results.
+              NoValidPairing if no pairing of the round avoids a rematch.
     """
-    db = connect()
-    db_cursor = db.cursor()
-    getPlayers = "SELECT id, name FROM v_standings"
-    fromTournament = " WHERE tournament = %s"
-    if tournament == 'blnk':
-        db_cursor.execute(getPlayers)
-    else:
-        db_cursor.execute(getPlayers + fromTournament, (tournament,))
-    players = db_cursor.fetchall()
-    swissPairs = []
-    alreadyPlayed = []
-    recordBye = []
-    countOfPlayers = len(players)
-    # Assign a bye week if there is an odd number of players in the round
-    if countOfPlayers % 2:
-        playersByLeastWins = """
-        SELECT v_standings.id AS id, v_standings.name AS name
-        FROM v_standings
-        ORDER BY v_standings.wins, v_standings.omw
-        """
-        db_cursor.execute(playersByLeastWins)
-        playersByLeastWins = db_cursor.fetchall()
-        playersAlreadyBye = """
-        SELECT player_id AS id, player_name AS name
-        FROM v_results
-        WHERE opponent_id=0
-        GROUP BY player_id, player_name
-        """
-        db_cursor.execute(playersAlreadyBye)
-        playersAlreadyBye = db_cursor.fetchall()
-        byeCandidates = [player for player in playersByLeastWins
-                          if player not in playersAlreadyBye]
-        playerWithBye = [byeCandidates[0],]
-        players = [player for player in players if player not in playerWithBye]
-        recordBye = (byeCandidates[0][0], byeCandidates[0][1], 0, 'BYE')
-        # print '==> Bye week for ' + str(playerWithBye)
-    # Pair players based on the stipulations in the doc string
-    while countOfPlayers > 1:
-        player = players[0]
-        findOpponents = """
-            SELECT waldo.id, waldo.name
-            FROM (
-                SELECT v_standings.*, oppid.played
-                FROM v_standings LEFT OUTER JOIN (
-                    SELECT v_results.opponent_id AS played
-                    FROM v_results
-                    WHERE v_results.player_id = %s
-                    GROUP BY v_results.opponent_id) AS oppid
-                ON v_standings.id = oppid.played) AS waldo
-            WHERE waldo.played IS NULL AND waldo.id <> %s
-            """
-        withTournament = " AND waldo.tournament =%s"
-        byeInEffect = " AND waldo.id <> %s"
-        if tournament == 'blnk':
-            if recordBye == []:
-                db_cursor.execute(findOpponents,
-                (str(player[0]), str(player[0])))
-            else:
-                db_cursor.execute(findOpponents + byeInEffect,
-                (str(player[0]), str(player[0]), str(playerWithBye[0][0])))
-        else:
-            if recordBye == []:
-                db_cursor.execute(findOpponents + withTournament,
-                (str(player[0]), str(player[0]), tournament))
-            else:
-                db_cursor.execute(findOpponents + withTournament + byeInEffect, (str(player[0]), str(player[0]), tournament,
-                str(playerWithBye[0][0])))
-
-        opponentList = db_cursor.fetchall()
-        opponentList = [opponent for opponent in opponentList
-                         if opponent not in alreadyPlayed]
+    deadline = time.time() + wait
+    while True:
         try:
-            opponent = opponentList[0]
-            # print '==> ' + str(player) + ' ... vs ... ' + str(opponent)
-            match = player + opponent
-            swissPairs += (match,)
-            alreadyPlayed += (player, opponent)
-            players = [x for x in players if x not in (player, opponent)]
-            countOfPlayers = len(players)
-        except:
-            print str(player) + ' has played all opponents in Tournament: ' + tournament
-            print 'Aborting swissPairings().'
+            swissPairs = _pairNextRound(tournament)
             break
-    db.rollback()
-    db.close()
-    recordBye = [recordBye,]
+        except RoundIncomplete:
+            if time.time() >= deadline:
+                raise
+            time.sleep(min(0.1, max(deadline - time.time(), 0)))
     for pair in swissPairs:
-        print '==> ' + str(pair)
-    if recordBye == [[]]:
-        return swissPairs
-    else:
-        print '==> ' + str(recordBye)
-        return recordBye + swissPairs
+        log.debug('Paired %s', pair)
+    return swissPairs
@@ -6,135 +6,426 @@ CREATE DATABASE tournament;
 \c tournament;
 
 
+/*
+players, games and standings are partitioned by tournament code, so a
+finished tournament can be removed by dropping or detaching its partitions
+instead of deleting its rows.  create_tournament() below adds the partitions
+of a new tournament, and its own "BYE" player (id 0) to support handling bye
+rounds.
+
+Apart from the BYE players, every player id is unique across all
+tournaments.  A partitioned table's unique indexes must include its
+partition key, so this is not enforced here: ids from players_id_seq never
+repeat, and explicit ids are checked against players_id when they are
+registered or imported (see TAKEN_PLAYER_ID_SQL in storage.py).
+*/
 CREATE TABLE players (
-	tournament   varchar(3),
+	tournament   varchar(3) NOT NULL,
 		  name   text,
-	  		id   serial PRIMARY KEY,
-);
+	  		id   serial,
+	PRIMARY KEY (tournament, id)
+) PARTITION BY LIST (tournament);
+
+CREATE INDEX players_id ON players (id);
+
+
+/*
+Each match is stored once, with the outcome from player_a's side: 'a' if
+player_a won, 'b' if player_b won and 't' for a tie.  A bye is stored as a
+match against the tournament's BYE player, who is always player_b.  round is
+the tournament's round that was still open when the match was reported, or
+else the round after the last one either player had played.
+*/
+CREATE TABLE games (
+	 tournament   varchar(3) NOT NULL,
+		  round   smallint,
+	   player_a   integer NOT NULL,
+	   player_b   integer NOT NULL,
+		outcome   char(1) NOT NULL CHECK (outcome IN ('a', 'b', 't')),
+		  entry   serial,
+	   pair_low   integer GENERATED ALWAYS AS (LEAST(player_a, player_b)) STORED,
+	  pair_high   integer GENERATED ALWAYS AS (GREATEST(player_a, player_b)) STORED,
+	PRIMARY KEY (tournament, entry),
+	-- Two players can only play each other once, whoever reported it.
+	UNIQUE (tournament, pair_low, pair_high),
+	FOREIGN KEY (tournament, player_a) REFERENCES players (tournament, id)
+		ON DELETE CASCADE,
+	FOREIGN KEY (tournament, player_b) REFERENCES players (tournament, id)
+		ON DELETE CASCADE,
+	CHECK (player_a <> player_b AND player_a <> 0)
+) PARTITION BY LIST (tournament);
 
--- Inserting a "BYE" player to support handling bye rounds
-INSERT INTO players (name, id) VALUES  ('BYE', 0);
+-- Support looking up a player's matches and counting a round's results.
+CREATE INDEX games_player_a ON games (player_a);
+CREATE INDEX games_player_b ON games (player_b);
+CREATE INDEX games_round ON games (tournament, round);
 
 
-CREATE TABLE matches (
-	 tournament   varchar(3),
-	  player_id   integer REFERENCES players (id) ON DELETE CASCADE,
-	opponent_id   integer REFERENCES players (id) ON DELETE CASCADE,
-		 result   text CHECK (result IN ('win', 'lose', 'tie')),
-		  entry   serial PRIMARY KEY,
-		 UNIQUE   (player_id, opponent_id)
+/*
+Every round that has been paired.  A round is open once swissPairings() has
+paired it, collecting once its first result is reported and closed once
+every table has reported and the next round is paired, or when it is closed
+by hand.  tables is the number of matches, including any bye, it was paired
+with.
+*/
+CREATE TABLE rounds (
+	 tournament   varchar(3) NOT NULL,
+		  round   smallint NOT NULL,
+		 status   text NOT NULL DEFAULT 'open'
+				  CHECK (status IN ('open', 'collecting', 'closed')),
+		 tables   integer NOT NULL,
+	PRIMARY KEY (tournament, round)
 );
 
 
+/*
+Create a view listing every match once from each player's side, plus byes
+from the side of the player who had them, in the shape the matches table
+had before matches were stored once.
+*/
+CREATE VIEW matches AS
+	SELECT
+		games.tournament AS tournament,
+		games.player_a AS player_id,
+		games.player_b AS opponent_id,
+		CASE games.outcome WHEN 'a' THEN 'win' WHEN 'b' THEN 'lose'
+			ELSE 'tie' END AS result,
+		games.entry AS entry,
+		games.round AS round
+	FROM games
+	UNION ALL
+	SELECT
+		games.tournament,
+		games.player_b,
+		games.player_a,
+		CASE games.outcome WHEN 'a' THEN 'lose' WHEN 'b' THEN 'win'
+			ELSE 'tie' END,
+		games.entry,
+		games.round
+	FROM games
+	WHERE games.player_b <> 0;
+
+
 /*
 Create table listing entry #, tournament, player id, player name,
 opponent id, opponent name and match result.
 */
 CREATE VIEW v_results AS (
 	SELECT
-		namingPlayers.entry AS entry,
-		namingPlayers.tournament AS tournament,
-		namingPlayers.player_id AS player_id,
-		namingPlayers.player_name AS player_name,
-		namingPlayers.opponent_id AS opponent_id,
-		players.name AS opponent_name,
-		namingPlayers.result AS result
-	FROM (
-		SELECT
-			matches.entry AS entry,
-			matches.tournament AS tournament,
-			matches.player_id AS player_id,
-			players.name AS player_name,
-			matches.opponent_id AS opponent_id,
-			matches.result AS result
-		FROM matches LEFT OUTER JOIN players ON matches.player_id = players.id
-		WHERE matches.player_id <> 0
-		GROUP BY
-			matches.entry,
-			players.name
-		ORDER BY matches.entry
-	) AS namingPlayers LEFT OUTER JOIN players
-	ON namingPlayers.opponent_id = players.id
-	GROUP BY
-		namingPlayers.entry,
-		namingPlayers.tournament,
-		namingPlayers.player_id,
-		namingPlayers.player_name,
-		namingPlayers.opponent_id,
-		players.name,
-		namingPlayers.result
-	ORDER BY entry
+		matches.entry AS entry,
+		matches.tournament AS tournament,
+		matches.player_id AS player_id,
+		player.name AS player_name,
+		matches.opponent_id AS opponent_id,
+		opponent.name AS opponent_name,
+		matches.result AS result
+	FROM matches LEFT OUTER JOIN players AS player
+	ON matches.tournament = player.tournament
+	AND matches.player_id = player.id
+	LEFT OUTER JOIN players AS opponent
+	ON matches.tournament = opponent.tournament
+	AND matches.opponent_id = opponent.id
+	WHERE matches.player_id <> 0
+	ORDER BY matches.entry
 );
 
 
--- Create a table listing player id, name, and # of wins
-CREATE VIEW v_wins AS (
-	SELECT
-		players.id AS id,
-		players.name AS name,
-		COALESCE(missing_zeros.wins, 0) AS wins
-	FROM players LEFT OUTER JOIN (
+/*
+Create a table holding each player's record and opponent match wins (OMW).
+It is kept up to date by the triggers below whenever players or matches are
+added or removed, so reading the standings never has to aggregate the
+matches table.  Run SELECT rebuild_standings(); to recompute it from scratch.
+*/
+CREATE TABLE standings (
+			 id   integer NOT NULL,
+	 tournament   varchar(3) NOT NULL,
+		   name   text,
+		   wins   integer NOT NULL DEFAULT 0,
+		 losses   integer NOT NULL DEFAULT 0,
+		   ties   integer NOT NULL DEFAULT 0,
+		matches   integer NOT NULL DEFAULT 0,
+			omw   integer NOT NULL DEFAULT 0,
+	PRIMARY KEY (tournament, id),
+	FOREIGN KEY (tournament, id) REFERENCES players (tournament, id)
+		ON DELETE CASCADE
+) PARTITION BY LIST (tournament);
+
+CREATE INDEX standings_id ON standings (id);
+
+
+/*
+Recompute the standings of the players passed in, from the tournaments
+passed in.  Their records are counted from their own match rows, and the OMW
+of those players and of everyone who has played them is summed again, since
+a change in a player's wins changes their opponents' OMW.  Every join also
+matches on tournament, so only those tournaments' partitions are read.
+*/
+CREATE FUNCTION refresh_standings(codes varchar(3)[], player_ids integer[])
+RETURNS void AS $$
+BEGIN
+	UPDATE standings SET
+		wins = records.wins,
+		losses = records.losses,
+		ties = records.ties,
+		matches = records.matches
+	FROM (
 		SELECT
-			players.id AS player_id,
-			players.name AS player_name,
-			count(v_results.result) AS wins
-		FROM players LEFT OUTER JOIN v_results ON players.id = v_results.player_id
-		WHERE v_results.result = 'win'
-		GROUP BY players.id, players.name
-		ORDER BY wins DESC
-		) AS missing_zeros ON players.id = missing_zeros.player_id
-	WHERE players.id <> 0
-	GROUP BY
-		players.id,
-		players.name,
-		missing_zeros.wins
-	ORDER BY wins DESC
-);
+			standings.tournament AS tournament,
+			standings.id AS id,
+			count(matches.result) FILTER (WHERE matches.result = 'win') AS wins,
+			count(matches.result) FILTER (WHERE matches.result = 'lose') AS losses,
+			count(matches.result) FILTER (WHERE matches.result = 'tie') AS ties,
+			count(matches.player_id) AS matches
+		FROM standings LEFT OUTER JOIN matches
+		ON standings.tournament = matches.tournament
+		AND standings.id = matches.player_id
+		WHERE standings.tournament = ANY (codes)
+		AND standings.id = ANY (player_ids)
+		GROUP BY standings.tournament, standings.id
+	) AS records
+	WHERE standings.tournament = records.tournament
+	AND standings.id = records.id;
 
+	UPDATE standings SET omw = opponent_wins.omw
+	FROM (
+		SELECT
+			affected.tournament AS tournament,
+			affected.id AS id,
+			COALESCE(sum(opponents.wins), 0) AS omw
+		FROM (
+			SELECT standings.tournament, standings.id
+			FROM standings
+			WHERE standings.tournament = ANY (codes)
+			AND standings.id = ANY (player_ids)
+			UNION
+			SELECT matches.tournament, matches.player_id
+			FROM matches
+			WHERE matches.tournament = ANY (codes)
+			AND matches.opponent_id = ANY (player_ids)
+		) AS affected LEFT OUTER JOIN matches
+		ON affected.tournament = matches.tournament
+		AND affected.id = matches.player_id
+		LEFT OUTER JOIN standings AS opponents
+		ON matches.tournament = opponents.tournament
+		AND matches.opponent_id = opponents.id
+		GROUP BY affected.tournament, affected.id
+	) AS opponent_wins
+	WHERE standings.tournament = opponent_wins.tournament
+	AND standings.id = opponent_wins.id;
+END;
+$$ LANGUAGE plpgsql;
 
--- Create a table listing player id, name, # of wins, and # of matches
-CREATE VIEW playerStandings AS (
-	SELECT
-		v_wins.*,
-		count(matches.player_id) AS matches
-	FROM v_wins LEFT OUTER JOIN matches
-	ON v_wins.id = matches.player_id
-	WHERE v_wins.id <> 0
-	GROUP BY v_wins.id, v_wins.name, v_wins.wins
-	ORDER BY v_wins.wins DESC
-);
 
+-- Recompute the standings of one tournament, or of every tournament
+CREATE FUNCTION rebuild_standings(code varchar(3) DEFAULT NULL) RETURNS void AS $$
+BEGIN
+	DELETE FROM standings WHERE code IS NULL OR standings.tournament = code;
+	INSERT INTO standings (id, tournament, name)
+		SELECT players.id, players.tournament, players.name
+		FROM players
+		WHERE players.id <> 0 AND (code IS NULL OR players.tournament = code);
+	PERFORM refresh_standings(
+		ARRAY(SELECT DISTINCT standings.tournament
+			  FROM standings
+			  WHERE code IS NULL OR standings.tournament = code),
+		ARRAY(SELECT standings.id
+			  FROM standings
+			  WHERE code IS NULL OR standings.tournament = code));
+END;
+$$ LANGUAGE plpgsql;
 
--- Create a table listing player id, name, tournament, # of OMWs
-CREATE VIEW v_omw AS (
-	SELECT
-	 	v_results.player_id AS id,
-		v_results.player_name AS name,
-		v_results.tournament AS tournament,
-		sum(v_wins.wins) as omw
-	FROM v_results LEFT OUTER JOIN v_wins
-	ON v_results.opponent_id = v_wins.id
-	WHERE v_results.player_id <> 0
-	GROUP BY v_results.player_id, v_results.player_name, v_results.tournament
+
+-- Whether a tournament's partitions are attached
+CREATE FUNCTION tournament_exists(code varchar(3)) RETURNS boolean AS $$
+	SELECT EXISTS (
+		SELECT 1 FROM pg_inherits
+		WHERE inhparent = 'players'::regclass
+		AND inhrelid = to_regclass(format('%I', 'players_' || code))
+	);
+$$ LANGUAGE sql STABLE;
+
+
+/*
+Add the partitions of a new tournament and its BYE player.  Does nothing if
+the tournament already exists.  Returns whether it was created.
+*/
+CREATE FUNCTION create_tournament(code varchar(3)) RETURNS boolean AS $$
+DECLARE
+	partition text;
+BEGIN
+	IF tournament_exists(code) THEN
+		RETURN false;
+	END IF;
+	PERFORM pg_advisory_xact_lock(hashtext('tournament ' || code));
+	IF tournament_exists(code) THEN
+		RETURN false;
+	END IF;
+	FOREACH partition IN ARRAY ARRAY['players', 'games', 'standings'] LOOP
+		EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES IN (%L)',
+			partition || '_' || code, partition, code);
+	END LOOP;
+	INSERT INTO players (tournament, name, id) VALUES (code, 'BYE', 0);
+	RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+
+/*
+Delete every match of one tournament, or of every tournament, by truncating
+their partitions, and reset the players' records.
+*/
+CREATE FUNCTION clear_matches(code varchar(3) DEFAULT NULL) RETURNS void AS $$
+BEGIN
+	IF code IS NULL THEN
+		TRUNCATE games;
+	ELSIF to_regclass(format('%I', 'games_' || code)) IS NOT NULL THEN
+		EXECUTE format('TRUNCATE %I', 'games_' || code);
+	END IF;
+	UPDATE standings
+	SET wins = 0, losses = 0, ties = 0, matches = 0, omw = 0
+	WHERE code IS NULL OR standings.tournament = code;
+	DELETE FROM rounds WHERE code IS NULL OR rounds.tournament = code;
+END;
+$$ LANGUAGE plpgsql;
+
+
+/*
+Remove a tournament by detaching its partitions.  They are then dropped,
+or, when archive is true, kept as stand-alone tables named after the
+partition and the time, e.g. players_ABC_20160314150926.
+*/
+CREATE FUNCTION purge_tournament(code varchar(3), archive boolean DEFAULT false)
+RETURNS void AS $$
+DECLARE
+	partition text;
+	detached text;
+	stamp text := to_char(clock_timestamp(), 'YYYYMMDDHH24MISS');
+	foreignKey text;
+BEGIN
+	PERFORM pg_advisory_xact_lock(hashtext('tournament ' || code));
+	DELETE FROM rounds WHERE rounds.tournament = code;
+	FOREACH partition IN ARRAY ARRAY['standings', 'games', 'players'] LOOP
+		detached := partition || '_' || code;
+		IF to_regclass(format('%I', detached)) IS NULL THEN
+			CONTINUE;
+		END IF;
+		EXECUTE format('ALTER TABLE %I DETACH PARTITION %I',
+			partition, detached);
+		-- Detached tables keep their foreign keys to players, which would
+		-- stop its own partition from being detached next.
+		FOR foreignKey IN
+			SELECT conname FROM pg_constraint
+			WHERE conrelid = to_regclass(format('%I', detached))
+			AND contype = 'f'
+		LOOP
+			EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I',
+				detached, foreignKey);
+		END LOOP;
+		IF archive THEN
+			EXECUTE format('ALTER TABLE %I RENAME TO %I',
+				detached, detached || '_' || stamp);
+		ELSE
+			EXECUTE format('DROP TABLE %I', detached);
+		END IF;
+	END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Give every newly registered player an empty record in the standings
+CREATE FUNCTION standings_players_inserted() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO standings (id, tournament, name)
+		SELECT new_players.id, new_players.tournament, new_players.name
+		FROM new_players
+		WHERE new_players.id <> 0;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER standings_players_inserted
+	AFTER INSERT ON players
+	REFERENCING NEW TABLE AS new_players
+	FOR EACH STATEMENT EXECUTE PROCEDURE standings_players_inserted();
+
+
+-- Refresh the standings of both players of every match that was changed
+CREATE FUNCTION standings_games_changed() RETURNS trigger AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		PERFORM refresh_standings(
+			ARRAY(SELECT DISTINCT tournament FROM new_games),
+			ARRAY(SELECT player_a FROM new_games
+				  UNION
+				  SELECT player_b FROM new_games));
+	ELSIF TG_OP = 'DELETE' THEN
+		PERFORM refresh_standings(
+			ARRAY(SELECT DISTINCT tournament FROM old_games),
+			ARRAY(SELECT player_a FROM old_games
+				  UNION
+				  SELECT player_b FROM old_games));
+	ELSE
+		PERFORM refresh_standings(
+			ARRAY(SELECT tournament FROM old_games
+				  UNION
+				  SELECT tournament FROM new_games),
+			ARRAY(SELECT player_a FROM old_games
+				  UNION
+				  SELECT player_b FROM old_games
+				  UNION
+				  SELECT player_a FROM new_games
+				  UNION
+				  SELECT player_b FROM new_games));
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER standings_games_inserted
+	AFTER INSERT ON games
+	REFERENCING NEW TABLE AS new_games
+	FOR EACH STATEMENT EXECUTE PROCEDURE standings_games_changed();
+
+CREATE TRIGGER standings_games_deleted
+	AFTER DELETE ON games
+	REFERENCING OLD TABLE AS old_games
+	FOR EACH STATEMENT EXECUTE PROCEDURE standings_games_changed();
+
+CREATE TRIGGER standings_games_updated
+	AFTER UPDATE ON games
+	REFERENCING OLD TABLE AS old_games NEW TABLE AS new_games
+	FOR EACH STATEMENT EXECUTE PROCEDURE standings_games_changed();
+
+
+-- Mark a round as collecting once its first result is reported
+CREATE FUNCTION rounds_games_inserted() RETURNS trigger AS $$
+BEGIN
+	UPDATE rounds SET status = 'collecting'
+	FROM (SELECT DISTINCT tournament, round FROM new_games) AS reported
+	WHERE rounds.tournament = reported.tournament
+	AND rounds.round = reported.round
+	AND rounds.status = 'open';
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rounds_games_inserted
+	AFTER INSERT ON games
+	REFERENCING NEW TABLE AS new_games
+	FOR EACH STATEMENT EXECUTE PROCEDURE rounds_games_inserted();
+
+
+-- Create a table listing player id, name, # of wins, and # of matches
+CREATE VIEW playerStandings AS (
+	SELECT id, name, wins, matches
+	FROM standings
+	ORDER BY wins DESC, omw DESC
 );
 
 
 -- Create a table listing player id, name, tournament, wins, and OMWs
 CREATE VIEW v_standings AS (
-	SELECT
-		players.id AS id,
-		players.name AS name,
-		players.tournament AS tournament,
-		wins_omw.wins AS wins,
-		wins_omw.omw AS omw
-	FROM players LEFT OUTER JOIN (
-		SELECT
-			v_wins.*,
-			v_omw.omw AS omw
-			FROM v_wins LEFT OUTER JOIN v_omw
-			ON v_wins.id = v_omw.id
-		) AS wins_omw ON players.id = wins_omw.id
-	WHERE players.id <> 0
-	GROUP BY players.id, players.name, players.tournament, wins_omw.wins, wins_omw.omw
-	ORDER BY wins_omw.wins DESC, wins_omw.omw DESC
+	SELECT id, name, tournament, wins, omw
+	FROM standings
+	ORDER BY wins DESC, omw DESC
 );
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+# tournament_async.py -- asyncio interface to the Swiss-system tournament
+# This file defines coroutine versions of the functions in tournament.py so a
+# single process can run many tournaments at once without a thread per call.
+# It uses the asyncpg driver and the same pairing, round and result logic as
+# tournament.py (see swiss.py and storage.py).  Requires Python 3.7 or newer.
+
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+import swiss
+from storage import (DELETE_ALL_PLAYERS_SQL, LOCK_PLAYER_IDS_SQL,
+                     NEW_PLAYER_IDS_SQL, REPORT_MATCHES_SQL,
+                     SYNC_PLAYER_IDS_SQL, TAKEN_PLAYER_ID_SQL,
+                     explicitPlayerIDs)
+from swiss import NoValidPairing, RoundIncomplete
+
+
+# The database to connect to.  This can be set with the TOURNAMENT_DSN
+# environment variable or by calling configure().
+DSN = os.environ.get('TOURNAMENT_DSN', 'dbname=tournament')
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 10
+
+_pool = None
+_connection = contextvars.ContextVar('tournament_connection', default=None)
+
+# libpq connection string keywords and the asyncpg arguments they map to.
+_DSN_KEYWORDS = {
+    'dbname': 'database',
+    'user': 'user',
+    'password': 'password',
+    'host': 'host',
+    'port': 'port',
+}
+
+
+def _connectArgs(dsn):
+    """Converts a DSN into arguments for asyncpg.
+
+    asyncpg only understands postgresql:// URIs, so libpq style keyword
+    strings such as 'dbname=tournament' are split into keyword arguments.
+    """
+    if '://' in dsn:
+        return {'dsn': dsn}
+    args = {}
+    for setting in dsn.split():
+        keyword, value = setting.split('=', 1)
+        if keyword not in _DSN_KEYWORDS:
+            raise ValueError("Unsupported DSN keyword %r." % keyword)
+        args[_DSN_KEYWORDS[keyword]] = value
+    return args
+
+
+async def configure(dsn=None, minconn=MIN_CONNECTIONS, maxconn=MAX_CONNECTIONS):
+    """Sets the database and connection pool size used by every coroutine.
+
+    Any existing pool is closed and a new one is opened on the next call
+    that needs the database.
+
+    Args:   dsn:  Optional connection string, either 'dbname=tournament' style
+                or a postgresql:// URI.  If no argument is passed the current
+                DSN is kept.
+            minconn:  Number of connections the pool keeps open.
+            maxconn:  Most connections the pool will open at once.  Callers
+                wait for a free connection once this many are in use.
+    """
+    global DSN, MIN_CONNECTIONS, MAX_CONNECTIONS, _pool
+    if _pool is not None:
+        await _pool.close()
+    if dsn is not None:
+        DSN = dsn
+    MIN_CONNECTIONS = minconn
+    MAX_CONNECTIONS = maxconn
+    _pool = None
+
+
+async def _getPool():
+    """Returns the connection pool, opening it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(min_size=MIN_CONNECTIONS,
+                                          max_size=MAX_CONNECTIONS,
+                                          **_connectArgs(DSN))
+    return _pool
+
+
+@asynccontextmanager
+async def transaction():
+    """Runs a block of work in one transaction on a pooled connection.
+
+    Every coroutine in this file uses transaction(), so awaiting several of
+    them inside an `async with transaction():` block groups their work into a
+    single transaction.  The transaction is committed when the outermost
+    block exits and rolled back if it raises an error.
+
+    Returns:  The transaction's asyncpg connection.
+    """
+    db = _connection.get()
+    if db is not None:
+        yield db
+        return
+    pool = await _getPool()
+    async with pool.acquire() as db:
+        token = _connection.set(db)
+        try:
+            async with db.transaction():
+                yield db
+        finally:
+            _connection.reset(token)
+
+
+async def deleteMatches(tournament='blnk'):
+    """Remove all the match records from an individual or all tournaments.
+
+    See tournament.deleteMatches().
+    """
+    async with transaction() as db:
+        if tournament == 'blnk':
+            await db.execute("SELECT clear_matches()")
+        else:
+            await db.execute("SELECT clear_matches($1)", tournament)
+
+
+async def deletePlayers(playerID='blnk'):
+    """Removes player(s) from the database.
+
+    See tournament.deletePlayers().
+    """
+    async with transaction() as db:
+        if playerID == 'blnk':
+            for query in DELETE_ALL_PLAYERS_SQL:
+                await db.execute(query)
+        else:
+            await db.execute("DELETE FROM players WHERE id = $1", int(playerID))
+
+
+async def countPlayers(tournament='blnk'):
+    """Returns the number of players registered.
+
+    See tournament.countPlayers().
+    """
+    async with transaction() as db:
+        if tournament == 'blnk':
+            return await db.fetchval(
+                "SELECT count(*) FROM players WHERE id <> 0")
+        return await db.fetchval(
+            "SELECT count(*) FROM players WHERE tournament = $1 AND id <> 0",
+            tournament)
+
+
+async def registerPlayer(tournament, name):
+    """Adds a player to the tournament database.
+
+    See tournament.registerPlayer().
+
+    Returns:  The id number assigned to the player.
+    """
+    async with transaction() as db:
+        await db.execute("SELECT create_tournament($1)", tournament)
+        return await db.fetchval(
+            "INSERT INTO players (tournament, name) VALUES ($1, $2) RETURNING id",
+            tournament, name)
+
+
+async def registerPlayers(tournament, players):
+    """Adds many players to a tournament in one transaction.
+
+    See tournament.registerPlayers().
+
+    Returns:  A list of the players' ids, in the order they were passed.
+
+    Raises:   ValueError if an id is given twice or is already taken.
+    """
+    players = [(None, player) if isinstance(player, str) else tuple(player)
+               for player in players]
+    if not players:
+        return []
+    explicitIDs = explicitPlayerIDs(players)
+    async with transaction() as db:
+        await db.execute("SELECT create_tournament($1)", tournament)
+        if explicitIDs:
+            await db.execute(LOCK_PLAYER_IDS_SQL)
+            taken = await db.fetchval(TAKEN_PLAYER_ID_SQL % {
+                'candidates': 'SELECT unnest($1::integer[]) AS id'},
+                explicitIDs)
+            if taken is not None:
+                raise ValueError("Player id %s is already taken." % taken)
+            await db.execute(SYNC_PLAYER_IDS_SQL % {'atLeast': '$1::integer'},
+                             max(explicitIDs))
+        rows = await db.fetch(NEW_PLAYER_IDS_SQL % {'count': '$1::integer'},
+                              len(players) - len(explicitIDs))
+        newIDs = iter([row[0] for row in rows])
+        ids = [next(newIDs) if playerID is None else playerID
+               for playerID, name in players]
+        await db.copy_records_to_table(
+            'players', columns=('tournament', 'id', 'name'),
+            records=[(tournament, playerID, name)
+                     for playerID, (ignored, name) in zip(ids, players)])
+    return ids
+
+
+async def playerStandings(tournament='blnk'):
+    """Returns a list of players and their win records, sorted by wins.
+
+    See tournament.playerStandings().
+    """
+    async with transaction() as db:
+        if tournament == 'blnk':
+            rows = await db.fetch("""
+                SELECT id, name, wins, matches FROM standings
+                ORDER BY wins DESC, omw DESC
+                """)
+        else:
+            rows = await db.fetch("""
+                SELECT id, name, wins, matches FROM standings
+                WHERE tournament = $1
+                ORDER BY wins DESC, omw DESC
+                """, tournament)
+    return [tuple(row) for row in rows]
+
+
+async def reportMatch(tournament, playerID, opponent, result):
+    """Records the outcome of a single match between two players.
+
+    See tournament.reportMatch().
+    """
+    await reportRound(tournament, [(playerID, opponent, result)])
+
+
+async def reportRound(tournament, results):
+    """Records the outcome of every match in a round in one transaction.
+
+    See tournament.reportRound().  The results are recorded in the
+    tournament's round that is not closed yet, and wait for swissPairings()
+    to finish pairing the next round.
+
+    Raises:   ValueError if any result in the round is invalid, or if two of
+                the players already played each other with another outcome
+                and one of them has played since.
+    """
+    rows = swiss.resultRows(tournament, results)
+    if not rows:
+        return
+    query = REPORT_MATCHES_SQL % {'reported': """
+        unnest($1::varchar[], $2::integer[], $3::integer[], $4::char[])
+        """}
+    async with transaction() as db:
+        await db.execute(
+            "SELECT pg_advisory_xact_lock_shared(hashtext('rounds ' || $1))",
+            tournament)
+        status = await db.execute(query,
+                                  *[list(column) for column in zip(*rows)])
+        if int(status.split()[-1]) < len(rows):
+            raise ValueError("A player has already played the same "
+                             "opponent in an earlier round.")
+
+
+async def _roundState(db, tournament):
+    """Returns a tournament's round state, see storage.Backend.roundState()."""
+    latest = await db.fetchrow("""
+        SELECT rounds.round, rounds.status, rounds.tables,
+               (SELECT count(*) FROM games
+                WHERE games.tournament = rounds.tournament
+                AND games.round = rounds.round)
+        FROM rounds
+        WHERE rounds.tournament = $1
+        ORDER BY rounds.round DESC
+        LIMIT 1
+        """, tournament)
+    played = await db.fetchval("""
+        SELECT COALESCE(max(round), 0) FROM games WHERE tournament = $1
+        """, tournament)
+    return dict(zip(('round', 'status', 'tables', 'reported'),
+                    latest or (0, None, 0, 0)), played=played)
+
+
+async def roundStatus(tournament):
+    """Returns the state of a tournament's latest round.
+
+    See tournament.roundStatus().
+    """
+    async with transaction() as db:
+        state = await _roundState(db, tournament)
+    del state['played']
+    return state
+
+
+async def closeRound(tournament):
+    """Closes a tournament's latest round even if results are missing.
+
+    See tournament.closeRound().
+    """
+    async with transaction() as db:
+        await db.execute(
+            "SELECT pg_advisory_xact_lock(hashtext('rounds ' || $1))",
+            tournament)
+        await db.execute("""
+            UPDATE rounds SET status = 'closed'
+            WHERE tournament = $1
+            AND round = (SELECT max(round) FROM rounds WHERE tournament = $1)
+            """, tournament)
+
+
+async def _pairNextRound(tournament):
+    """Pairs a tournament's next round and records it as open.
+
+    See tournament._pairNextRound().
+    """
+    async with transaction() as db:
+        closing = None
+        if tournament != 'blnk':
+            # Wait for every submission in progress to commit.
+            await db.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('rounds ' || $1))",
+                tournament)
+            number, closing = swiss.nextRound(
+                tournament, await _roundState(db, tournament))
+        if tournament == 'blnk':
+            standings = await db.fetch("""
+                SELECT id, name, wins, omw FROM standings
+                ORDER BY wins DESC, omw DESC
+                """)
+            history = await db.fetch(
+                "SELECT player_a, player_b, outcome FROM games")
+        else:
+            standings = await db.fetch("""
+                SELECT id, name, wins, omw FROM standings
+                WHERE tournament = $1
+                ORDER BY wins DESC, omw DESC
+                """, tournament)
+            history = await db.fetch("""
+                SELECT player_a, player_b, outcome FROM games
+                WHERE tournament = $1
+                """, tournament)
+        swissPairs, aborted = swiss.pairRound(
+            [tuple(row) for row in standings], swiss.historyRows(history))
+        if aborted is not None:
+            raise NoValidPairing(
+                'Player %s of tournament %s can not be paired without a '
+                'rematch.' % (aborted, tournament))
+        if closing is not None:
+            await db.execute("""
+                UPDATE rounds SET status = 'closed'
+                WHERE tournament = $1 AND round = $2
+                """, tournament, closing)
+        if tournament != 'blnk':
+            await db.execute("""
+                INSERT INTO rounds (tournament, round, tables)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (tournament, round) DO UPDATE
+                SET status = 'open', tables = EXCLUDED.tables
+                """, tournament, number, len(swissPairs))
+    return swissPairs
+
+
+async def swissPairings(tournament='blnk', wait=0):
+    """Returns a list of pairs of players for the next round of a match.
+
+    See tournament.swissPairings().  Pairings are computed by
+    swiss.pairRound() and recorded as the tournament's next round, just as
+    tournament.swissPairings() records them.
+
+    Raises:   RoundIncomplete if the current round is still missing results.
+              NoValidPairing if no pairing of the round avoids a rematch.
+    """
+    deadline = time.time() + wait
+    while True:
+        try:
+            return await _pairNextRound(tournament)
+        except RoundIncomplete:
+            if time.time() >= deadline:
+                raise
+            await asyncio.sleep(min(0.1, max(deadline - time.time(), 0)))
@@ -2,8 +2,24 @@
 #
 # Test cases for tournament.py
 
+import json
+import threading
+import time
+import urllib2
+from StringIO import StringIO
+
+import service
+import sharding
+import storage
+import swiss
 from tournament import *
 
+try:
+    import tiebreaks
+except ImportError:
+    # NumPy is not installed, so the tie-break test is skipped.
+    tiebreaks = None
+
 def testDeleteMatches():
     deleteMatches()
     print "1. Old matches can be deleted."
@@ -127,6 +143,379 @@ def testPairings():
     print "8. After one match, players with one win are paired."
 
 
+def testReportRound():
+    deleteMatches()
+    deletePlayers()
+    registerPlayer("ABC", "Rarity")
+    registerPlayer("ABC", "Spike")
+    registerPlayer("ABC", "Rainbow Dash")
+    standings = playerStandings()
+    [id1, id2, id3] = [row[0] for row in standings]
+    try:
+        reportRound('ABC', [(id1, id2, 'win'), (id3, 0, 'draw')])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("reportRound() should reject an invalid result.")
+    if [row for row in playerStandings() if row[3] != 0]:
+        raise ValueError("A rejected round should not record any matches.")
+    reportRound('ABC', [(id1, id2, 'win'), (id3, 0, 'win')])
+    standings = playerStandings()
+    for (i, n, w, m) in standings:
+        if m != 1:
+            raise ValueError("Each player should have one match recorded.")
+        if i in (id1, id3) and w != 1:
+            raise ValueError("Each match winner should have one win recorded.")
+        elif i == id2 and w != 0:
+            raise ValueError("Each match loser should have zero wins recorded.")
+    print "9. A whole round, including the bye, can be reported at once."
+
+
+def testRegisterPlayers():
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers("ABC", [(500, "Sunset Shimmer"), "Starlight Glimmer",
+                                  "Trixie Lulamoon"])
+    if len(ids) != 3 or ids[0] != 500:
+        raise ValueError("registerPlayers() should return every player's id, "
+                         "keeping explicit ids, in the order passed.")
+    if len(set(ids)) != 3:
+        raise ValueError("registerPlayers() should assign unique ids.")
+    newID = registerPlayer("ABC", "Maud Pie")
+    if newID in ids:
+        raise ValueError("Players registered after an import should not reuse "
+                         "an imported id.")
+    c = countPlayers('ABC')
+    if c != 4:
+        raise ValueError(
+            "After registering four players, countPlayers should be 4.")
+    print "10. Players can be registered in bulk with or without ids."
+
+
+def testStandingsCache():
+    deleteMatches()
+    deletePlayers()
+    id1, id2 = registerPlayers("ABC", ["Applejack", "Big McIntosh"])
+    id3, id4 = registerPlayers("XYZ", ["Granny Smith", "Apple Bloom"])
+    before = cacheStats()['hits']
+    playerStandings("ABC")
+    playerStandings("ABC")
+    playerStandings()
+    if cacheStats()['hits'] != before + 1:
+        raise ValueError("Reading unchanged standings again should be served "
+                         "from the cache.")
+    reportMatch("ABC", id1, id2, 'win')
+    if [row[2] for row in playerStandings("ABC")] != [1, 0]:
+        raise ValueError("Reporting a match should invalidate the cached "
+                         "standings of its tournament.")
+    if sum(row[2] for row in playerStandings()) != 1:
+        raise ValueError("Reporting a match should invalidate the cached "
+                         "standings of all tournaments.")
+    with transaction():
+        reportMatch("XYZ", id3, id4, 'win')
+        playerStandings("XYZ")
+    if [row[2] for row in playerStandings("XYZ")] != [1, 0]:
+        raise ValueError("Standings read inside a transaction should not be "
+                         "cached.")
+    deleteMatches("ABC")
+    if [row[2] for row in playerStandings("ABC")] != [0, 0]:
+        raise ValueError("Deleting matches should invalidate the cached "
+                         "standings.")
+    deletePlayers(id4)
+    if len(playerStandings("XYZ")) != 1:
+        raise ValueError("Deleting a player should invalidate the cached "
+                         "standings.")
+    print "11. Standings are cached until a tournament changes."
+
+
+def testExportImport():
+    deleteMatches()
+    deletePlayers()
+    id1, id2, id3 = registerPlayers("ABC", ["Rarity", "Spike", "Sweetie Belle"])
+    reportRound("ABC", [(id1, id2, 'win'), (id3, 0, 'win')])
+    standings = list(iterStandings("ABC", fetchSize=2))
+    if standings != playerStandings("ABC"):
+        raise ValueError("iterStandings() should yield the same rows as "
+                         "playerStandings().")
+    written = []
+    for row in iterStandings("ABC", fetchSize=1):
+        written.append(registerPlayer("XYZ", "Pinkie Pie"))
+        counts = []
+        reader = threading.Thread(
+            target=lambda: counts.append(countPlayers("XYZ")))
+        reader.start()
+        reader.join()
+        if counts != [len(written)]:
+            raise ValueError("A player registered while iterating should be "
+                             "committed at once.")
+    if len(written) != 3:
+        raise ValueError("Writing while iterating should not end the "
+                         "iteration.")
+    results = list(iterResults("ABC", fetchSize=2))
+    if len(results) != 3 or results[-1][4:] != (0, 'BYE', 'win'):
+        raise ValueError("iterResults() should yield each match once per "
+                         "player and the bye once.")
+    players, matches = StringIO(), StringIO()
+    exportTournament("ABC", players, matches)
+    deletePlayers()
+    players.seek(0)
+    matches.seek(0)
+    importTournament(players, matches)
+    if playerStandings("ABC") != standings:
+        raise ValueError("Importing an exported tournament should restore its "
+                         "standings.")
+    if [row[1:] for row in iterResults("ABC")] != [row[1:] for row in results]:
+        raise ValueError("Importing an exported tournament should restore its "
+                         "matches.")
+    print "12. Tournaments can be streamed, exported and imported."
+
+
+def testPurgeTournament():
+    deleteMatches()
+    deletePlayers()
+    if not createTournament("ABC") or createTournament("ABC"):
+        raise ValueError("createTournament() should only create a tournament "
+                         "once.")
+    id1, id2 = registerPlayers("ABC", ["Derpy Hooves", "Lyra Heartstrings"])
+    id3, id4 = registerPlayers("XYZ", ["Bon Bon", "Octavia Melody"])
+    reportRound("ABC", [(id1, id2, 'win')])
+    reportRound("XYZ", [(id3, id4, 'tie')])
+    playerStandings()
+    purgeTournament("ABC")
+    if countPlayers("ABC") != 0 or countPlayers() != 2:
+        raise ValueError("Purging a tournament should remove only its "
+                         "players.")
+    if [row[3] for row in playerStandings()] != [1, 1]:
+        raise ValueError("Purging a tournament should leave other "
+                         "tournaments' matches alone.")
+    purgeTournament("XYZ", archive=True)
+    if countPlayers() != 0:
+        raise ValueError("Archiving a tournament should remove its players.")
+    print "13. Whole tournaments can be purged or archived."
+
+
+def testRoundLifecycle():
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers("ABC", ["Twilight Sparkle", "Fluttershy",
+                                  "Applejack", "Pinkie Pie"])
+    pairs = swissPairings("ABC")
+    if sorted(pair[i] for pair in pairs for i in (0, 2)) != sorted(ids):
+        raise ValueError("Every registered player should be paired.")
+    if swissPairings("ABC") != pairs or roundStatus("ABC")["round"] != 1:
+        raise ValueError("Pairing again before any results should re-pair "
+                         "the same round.")
+    results = [(pair[0], pair[2], 'win') for pair in pairs]
+    reportRound("ABC", results[:1])
+    try:
+        swissPairings("ABC")
+    except RoundIncomplete:
+        pass
+    else:
+        raise ValueError("swissPairings() should refuse to pair a round "
+                         "while results are missing.")
+    reportRound("ABC", results)
+    reportMatch("ABC", results[0][0], results[0][1], 'lose')
+    standings = playerStandings("ABC")
+    if sum(row[3] for row in standings) != 4 or \
+            sum(row[2] for row in standings) != 2:
+        raise ValueError("Reporting a match again should replace it, not "
+                         "record it twice.")
+    status = roundStatus("ABC")
+    if status["status"] != "collecting" or status["reported"] != 2:
+        raise ValueError("The round should be collecting with both results "
+                         "reported.")
+    nextPairs = swissPairings("ABC")
+    status = roundStatus("ABC")
+    if status["round"] != 2 or status["status"] != "open":
+        raise ValueError("A complete round should be closed when the next "
+                         "one is paired.")
+    try:
+        reportMatch("ABC", results[1][0], results[1][1], 'win')
+    except ValueError:
+        raise ValueError("A match should be reportable again until either "
+                         "player plays again.")
+    reportRound("ABC", [(pair[0], pair[2], 'win') for pair in nextPairs])
+    try:
+        reportMatch("ABC", results[0][1], results[0][0], 'win')
+    except ValueError:
+        raise ValueError("Reporting the recorded outcome again should succeed "
+                         "even after either player has played again.")
+    try:
+        reportMatch("ABC", results[0][0], results[0][1], 'win')
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A match should not change once either player has "
+                         "played again.")
+    closeRound("ABC")
+    if roundStatus("ABC")["status"] != "closed":
+        raise ValueError("closeRound() should close the latest round.")
+    print "14. Rounds are tracked and results can be reported again safely."
+
+
+def testCompletePairings():
+    standings = [(1, "A", 0, 0), (2, "B", 0, 0), (3, "C", 0, 0),
+                 (4, "D", 0, 0)]
+    history = [(1, 2, 'tie'), (2, 1, 'tie'), (2, 4, 'tie'), (4, 2, 'tie')]
+    pairs, aborted = swiss.pairRound(standings, history)
+    if aborted is not None or \
+            set(frozenset([p[0], p[2]]) for p in pairs) != \
+            set([frozenset([1, 4]), frozenset([2, 3])]):
+        raise ValueError("Pairing should find the only rematch-free pairing "
+                         "even when pairing from the top down gets stuck.")
+    deleteMatches()
+    deletePlayers()
+    registerPlayers("ABC", ["Rarity", "Spike", "Rainbow Dash", "Scootaloo"])
+    for number in range(3):
+        pairs = swissPairings("ABC")
+        if len(pairs) != 2:
+            raise ValueError("Every round of a round robin should be paired.")
+        reportRound("ABC", [(p[0], p[2], 'win') for p in pairs])
+    try:
+        swissPairings("ABC")
+    except NoValidPairing:
+        pass
+    else:
+        raise ValueError("swissPairings() should raise NoValidPairing once "
+                         "everyone has played everyone.")
+    # A large field whose last 40 players have all played each other must
+    # fall back to the maximum matching, and still pair quickly.
+    standings = [(i, str(i), 0, 0) for i in range(1, 10001)]
+    history = [(a, b, 'tie') for a in range(9961, 10001)
+               for b in range(9961, 10001) if a != b]
+    start = time.time()
+    pairs, aborted = swiss.pairRound(standings, history)
+    if aborted is not None or len(pairs) != 5000:
+        raise ValueError("A large field should be paired in full.")
+    if time.time() - start > 2:
+        raise ValueError("Pairing 10000 players took %.1f seconds." %
+                         (time.time() - start))
+    print "15. Rounds are fully paired whenever a valid pairing exists."
+
+
+def testShards():
+    previous = getBackend()
+    shards = sharding.ShardedBackend(
+        {"east": storage.MemoryBackend(1, 2),
+         "west": storage.MemoryBackend(2, 2)},
+        {"ABC": "east", "XYZ": "west"})
+    useBackend(shards)
+    try:
+        id1, id2 = registerPlayers("ABC", ["Derpy Hooves", "Lyra Heartstrings"])
+        id3, id4 = registerPlayers("XYZ", ["Bon Bon", "Octavia Melody"])
+        if shards.shards["west"].countPlayers() != 2 or \
+                shards.shardFor("QRS") != shards.shardFor("QRS"):
+            raise ValueError("Each tournament should be kept on its shard.")
+        id5 = registerPlayer("XYZ", "Vinyl Scratch")
+        reportRound("ABC", [(id1, id2, 'win')])
+        reportRound("XYZ", [(id3, id4, 'win')])
+        reportMatch("XYZ", id4, id5, 'win')
+        if countPlayers() != 5 or countPlayers("ABC") != 2:
+            raise ValueError("countPlayers() should add up every shard.")
+        standings = playerStandings()
+        if set(row[0] for row in standings[:2]) != set([id3, id4]) or \
+                standings[2][0] != id1:
+            raise ValueError("Standings of every shard should be merged by "
+                             "wins and then OMW.")
+        if [row[3] for row in standings if row[0] == id4] != [2]:
+            raise ValueError("Merged standings should count every match.")
+        deleteMatches()
+        if [row for row in playerStandings() if row[3] != 0]:
+            raise ValueError("deleteMatches() should clear every shard.")
+        # 107 is an id of the east shard's kind, explicitly given to a
+        # player of the west shard.
+        east = registerPlayers("ABC", [(105, "Cheerilee"), "Roseluck"])
+        west = registerPlayers("XYZ", [(107, "Coco Pommel"), "Mayor Mare"])
+        if east[1] % 2 != 1 or east[1] < 105 or \
+                west[1] % 2 != 0 or west[1] < 107:
+            raise ValueError("A shard should keep handing out ids of its own "
+                             "after registering explicit ids.")
+    finally:
+        useBackend(previous)
+    print "16. Tournaments can be spread across shards."
+
+
+def testService():
+    deleteMatches()
+    deletePlayers()
+    server = service.TournamentServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%s/tournaments/ABC/' % server.server_address[1]
+
+    def call(path, body=None):
+        data = None if body is None else json.dumps(body)
+        return json.load(urllib2.urlopen(url + path, data))
+
+    try:
+        ids = call('players', {"names": ["Twilight Sparkle", "Fluttershy",
+                                         "Applejack", "Pinkie Pie"]})["ids"]
+        if call('players')["count"] != 4:
+            raise ValueError("The service should register players.")
+        submitters = [threading.Thread(
+            target=call, args=('results', {"results": [[ids[i], ids[i + 1],
+                                                        "win"]]}))
+            for i in (0, 2)]
+        for submitter in submitters:
+            submitter.start()
+        for submitter in submitters:
+            submitter.join()
+        standings = call('standings')["standings"]
+        if sorted(row[0] for row in standings[:2]) != [ids[0], ids[2]]:
+            raise ValueError("Results sent to the service should be "
+                             "recorded.")
+        try:
+            call('results', {"results": [[ids[0], ids[1], "draw"]]})
+        except urllib2.HTTPError as error:
+            if error.code != 400:
+                raise
+        else:
+            raise ValueError("The service should reject invalid results.")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print "17. The service registers players and batches results."
+
+
+def testTiebreaks():
+    if tiebreaks is None:
+        print "18. Tie-breaks were skipped, since NumPy is not installed."
+        return
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers("ABC", ["Applejack", "Rarity", "Fluttershy",
+                                  "Pinkie Pie"])
+    reportRound("ABC", [(ids[0], ids[1], 'win'), (ids[2], ids[3], 'tie')])
+    reportRound("ABC", [(ids[0], ids[2], 'win'), (ids[1], ids[3], 'win')])
+    standings, history = getBackend().pairingSnapshot("ABC")
+    scores = tiebreaks.compute(ids, history)
+    expected = {
+        'points': [2, 1, 0.5, 0.5],
+        'omw': [1, 2, 2, 1],
+        'omwPercentage': [5 / 12.0, 2 / 3.0, 2 / 3.0, 5 / 12.0],
+        'buchholz': [1.5, 2.5, 2.5, 1.5],
+        'medianBuchholz': [1.5, 2.5, 2.5, 1.5],
+        'sonnebornBerger': [1.5, 0.5, 0.25, 0.25],
+    }
+    for name, values in expected.items():
+        if [round(score, 6) for score in scores[name]] != \
+                [round(value, 6) for value in values]:
+            raise ValueError("The %s tie-break should be %s, not %s." %
+                             (name, values, list(scores[name])))
+    setTiebreaks('sonnebornBerger', 'buchholz')
+    try:
+        ranked = tiebreakStandings("ABC")
+    finally:
+        setTiebreaks('omw')
+    if [row[0] for row in ranked] != ids or \
+            [row[4:] for row in ranked][2:] != [(0.25, 2.5), (0.25, 1.5)]:
+        raise ValueError("tiebreakStandings() should order players by wins "
+                         "and then by each tie-break in turn.")
+    print "18. Tie-breaks are computed for a known bracket."
+
+
 if __name__ == '__main__':
     testDeleteMatches()
     testDelete()
@@ -136,4 +525,14 @@ if __name__ == '__main__':
     testStandingsBeforeMatches()
     testReportMatches()
     testPairings()
+    testReportRound()
+    testRegisterPlayers()
+    testStandingsCache()
+    testExportImport()
+    testPurgeTournament()
+    testRoundLifecycle()
+    testCompletePairings()
+    testShards()
+    testService()
+    testTiebreaks()
     print "Success!  All tests pass!"